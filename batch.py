@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""A NumPy-backed counterpart to game.Dice that holds the dice of many
+games at once, for bulk simulations where per-die Python objects and
+per-die calls to random.randint are too slow.
+
+Scoring uses the same table as game.Scorecard, so the rules are the
+same by construction."""
+
+import numpy as np
+
+from game import ROLLS, SCORE_TABLE, CAT_INDEX
+
+FACES = np.arange(1, 7, dtype=np.uint8)
+_BITS = np.arange(5, dtype=np.uint8)
+
+# A roll is keyed by its count of each face, read as a base-6 number.
+# _KEY_TO_INDEX maps those keys back to indices in game.ROLLS, so a
+# whole batch of rolls can be scored with two fancy-indexing lookups.
+_KEY_WEIGHTS = 6 ** np.arange(6)
+_KEY_TO_INDEX = np.zeros(6 ** 6, dtype=np.int16)
+for _i, _roll in enumerate(ROLLS):
+    _KEY_TO_INDEX[np.bincount(_roll, minlength=7)[1:] @ _KEY_WEIGHTS] = _i
+SCORES = np.array(SCORE_TABLE, dtype=np.uint8)
+SCORES.flags.writeable = False
+
+def hold_mask(held):
+    """Converts `held` to an (N, 5) boolean array.  `held` may already
+    be one, or may be a length-N sequence of integer bitmasks in which
+    bit i is set if die i is held."""
+    held = np.asarray(held)
+    if held.ndim == 1:
+        return ((held[:, None] >> _BITS) & 1).astype(bool)
+    return held.astype(bool, copy=False)
+
+class BatchDice:
+
+    """The five dice of each of `n` games, stored as one (n, 5) uint8
+    array.  `rng` may be a numpy Generator or anything that
+    numpy.random.default_rng accepts as a seed."""
+
+    def __init__(self, n=None, values=None, rng=None):
+        self.rng = np.random.default_rng(rng)
+        if values is not None:
+            self.values = np.array(values, dtype=np.uint8).reshape(-1, 5)
+        else:
+            self.values = self.rng.integers(1, 7, size=(n, 5),
+                                            dtype=np.uint8)
+        self.rolled = np.zeros(len(self.values), dtype=np.uint8)
+
+    def __len__(self):
+        return len(self.values)
+
+    def roll(self, held=None):
+        """Rolls every die that is not held.  `held` is as for
+        hold_mask(); if it is None, every die is rolled.  As with
+        game.Dice, holds only apply to the roll they are passed to."""
+        new = self.rng.integers(1, 7, size=self.values.shape, dtype=np.uint8)
+        if held is None:
+            self.values = new
+        else:
+            np.copyto(self.values, new, where=~hold_mask(held))
+        self.rolled += 1
+
+    @property
+    def count(self):
+        """An (n, 6) array of how many of each face each game has."""
+        return (self.values[:, :, None] == FACES).sum(axis=1)
+
+    @property
+    def total(self):
+        return self.values.sum(axis=1, dtype=np.int32)
+
+    @property
+    def index(self):
+        """The index in game.ROLLS of each game's current roll."""
+        return _KEY_TO_INDEX[self.count @ _KEY_WEIGHTS]
+
+    def score_all(self):
+        """Returns an (n, 13) array of the score each game's dice would
+        give in each category, in the order of game.CATEGORIES."""
+        return SCORES[self.index]
+
+    def score(self, cat):
+        """Returns the score each game's dice would give in `cat`."""
+        return SCORES[self.index, CAT_INDEX[cat]]
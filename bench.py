@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Benchmarks for the hot paths of the game, and for the network
+transport.
+
+Run `python bench.py` to print the results as JSON, giving the best
+time per operation (in seconds) for each benchmark.  `--save FILE`
+writes them to a file to use as a baseline, and `--baseline FILE`
+compares against one, exiting with status 1 if any benchmark is slower
+than the baseline by more than the threshold (10% by default)."""
+
+from argparse import ArgumentParser
+from socket import socket
+from threading import Thread
+import json
+import platform
+import sys
+import timeit
+
+from game import Dice, Scorecard, UPPER_SECTION
+from connect import Connection
+from rng import DiceRNG
+import tournament
+
+BENCHMARKS = {}
+
+def benchmark(name):
+    """Registers a function as the benchmark `name`.  The function sets
+    up whatever it needs and returns a callable that performs one
+    operation, and optionally the number of operations that callable
+    counts as."""
+    def register(func):
+        BENCHMARKS[name] = func
+        return func
+    return register
+
+# Micro-benchmarks
+
+@benchmark('dice.roll')
+def bench_roll():
+    return Dice(rng=DiceRNG(0)).roll
+
+def _scoring(method, *args):
+    dice = Dice([3, 3, 4, 5, 6])
+    func = getattr(Scorecard(), method)
+    return lambda: func(*args, dice, preview=True)
+
+for _n, _cat in enumerate(UPPER_SECTION, 1):
+    benchmark('scorecard.upper.' + _cat)(
+        lambda n=_n: _scoring('upper', n))
+
+for _method in ('three_kind', 'four_kind', 'full_house', 'short_straight',
+                'long_straight', 'yahtzee', 'chance'):
+    benchmark('scorecard.' + _method)(lambda m=_method: _scoring(m))
+
+@benchmark('scorecard.score')
+def bench_score():
+    return _scoring('score', 'fh')
+
+@benchmark('scorecard.score_all')
+def bench_score_all():
+    dice = Dice([3, 3, 4, 5, 6])
+    return lambda: Scorecard().score_all(dice)
+
+@benchmark('scorecard.preview')
+def bench_preview():
+    dice = Dice([3, 3, 4, 5, 6])
+    scorecard = _half_full()
+    return lambda: scorecard.preview(dice)
+
+def _half_full():
+    scorecard = Scorecard()
+    dice = Dice([6, 6, 6, 2, 2])
+    for cat in ('sixes', 'twos', '3x', 'fh', 'c', 'y'):
+        scorecard.score(cat, dice)
+    return scorecard
+
+@benchmark('scorecard.total')
+def bench_total():
+    scorecard = _half_full()
+    return lambda: scorecard.total
+
+@benchmark('scorecard.is_full')
+def bench_is_full():
+    scorecard = _half_full()
+    return lambda: scorecard.is_full
+
+# Macro-benchmarks
+
+@benchmark('game.play.2p')
+def bench_game():
+    strategies = [tournament.greedy, tournament.greedy]
+    rng = DiceRNG(0)
+    return lambda: tournament.play_game(strategies, rng)
+
+# Network
+
+class _Connection(Connection):
+    # Connection.__init__ ends by running the main loop; we want to
+    # drive it ourselves.
+    def mainloop(self):
+        pass
+
+def _free_port():
+    s = socket()
+    s.bind(('localhost', 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+@benchmark('connection.messages')
+def bench_connection(messages=10000):
+    port = _free_port()
+    conns = {}
+    listener = Thread(target=lambda: conns.setdefault(
+        'server', _Connection('localhost', port, None, listener=True)))
+    listener.start()
+    while listener.is_alive():
+        try:
+            conns['client'] = _Connection('localhost', port, None)
+        except ConnectionRefusedError:
+            continue
+        break
+    listener.join()
+    client, server = conns['client'], conns['server']
+    line = 'SCORED alan fh 25 125'
+    def send_and_receive():
+        sender = Thread(target=lambda: [client.send(line)
+                                        for _ in range(messages)])
+        sender.start()
+        for _ in range(messages):
+            server.receive()
+        sender.join()
+    return send_and_receive, messages
+
+def run(names=None, repeat=5, min_time=0.2):
+    """Runs the named benchmarks (by default, all of them) and returns
+    a dict mapping each name to its best time per operation."""
+    results = {}
+    for name in names or BENCHMARKS:
+        setup = BENCHMARKS[name]()
+        func, ops = setup if isinstance(setup, tuple) else (setup, 1)
+        timer = timeit.Timer(func)
+        number, _ = timer.autorange()
+        number = max(1, int(number * min_time / 0.2))
+        best = min(timer.repeat(repeat, number))
+        results[name] = best / (number * ops)
+    return results
+
+def compare(results, baseline, threshold=0.1):
+    """Returns a dict mapping the name of each benchmark that has got
+    more than `threshold` slower than in `baseline` to its ratio of new
+    time to old."""
+    regressions = {}
+    for name, t in results.items():
+        old = baseline.get(name)
+        if old and t > old * (1 + threshold):
+            regressions[name] = t / old
+    return regressions
+
+if __name__ == '__main__':
+
+    parser = ArgumentParser(description='Benchmark the game.')
+    parser.add_argument('names', nargs='*', metavar='NAME',
+                        help='benchmarks to run (default: all)')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--save', metavar='FILE',
+                        help='save the results as a baseline')
+    parser.add_argument('--baseline', metavar='FILE',
+                        help='compare the results with a saved baseline')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='fractional slowdown counted as a regression')
+    args = parser.parse_args()
+
+    results = run(args.names, args.repeat)
+    output = {
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'results': results
+    }
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(output, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        output['regressions'] = compare(results, baseline, args.threshold)
+    json.dump(output, sys.stdout, indent=2)
+    print()
+    if output.get('regressions'):
+        sys.exit(1)
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Checkpoints of any number of live games, so that a server can be
+restarted, or recover from a crash, without losing them.
+
+A checkpoint file starts with MAGIC and is then a series of records,
+each giving the state of one game under a key (such as the name of the
+server's session), or saying that the game with that key has gone:
+
+    kind            1 byte, GAME or GONE
+    key length      2 bytes
+    names length    2 bytes
+    key             utf-8
+    player names    utf-8, separated by newlines
+    state           a wire.py STATE frame (GAME records only)
+
+A later record for a key replaces any earlier one.  Checkpoint.save()
+only appends records for the games that have changed since it was last
+called, which it knows about from listeners on the games, and now and
+then rewrites the whole file instead so that it doesn't grow without
+limit.  A record cut short by a crash is ignored by load()."""
+
+from struct import Struct
+import gc
+import os
+
+from game import Game
+from wire import encode_state, apply, frame_size
+
+MAGIC = b'YZCK\x01'
+
+GONE, GAME = range(2)
+
+_RECORD = Struct('!BHH')
+
+def _record(key, game):
+    key = key.encode()
+    if game is None:
+        return _RECORD.pack(GONE, len(key), 0) + key
+    names = '\n'.join(p.name for p in game.players).encode()
+    return b''.join((_RECORD.pack(GAME, len(key), len(names)), key, names,
+                     encode_state(game)))
+
+class Checkpoint:
+
+    """Keeps the file at `path` up to date with the games tracked.  The
+    whole file is rewritten, rather than appended to, once it holds
+    more than `compact_after` records per game tracked."""
+
+    def __init__(self, path, compact_after=4):
+        self.path = path
+        self.compact_after = compact_after
+        self.games = {}
+        self.dirty = set()
+        self.file = None
+        # Records in the file, or None before the first snapshot
+        self.records = None
+
+    def track(self, key, game):
+        """Starts checkpointing `game` under `key`."""
+        self.games[key] = game
+        self.dirty.add(key)
+        def changed(game, event, *args):
+            if self.games.get(key) is game:
+                self.dirty.add(key)
+        game.listeners.append(changed)
+
+    def forget(self, key):
+        """Stops checkpointing the game under `key`, and removes it
+        from the file at the next save."""
+        if self.games.pop(key, None) is not None:
+            self.dirty.add(key)
+
+    def save(self):
+        """Brings the file up to date."""
+        self.write(self.collect())
+
+    def collect(self):
+        """Encodes what save() would write, and returns it to be passed
+        to write(), or None if there's nothing to write.  Only this part
+        needs the games to keep still, so a server can call it between
+        moves and leave write(), which waits for the disk, to a thread.
+        Each result must be written, in order, before the next is
+        collected."""
+        if (self.records is None or
+                self.records > self.compact_after * max(16, len(self.games))):
+            self.records = len(self.games)
+            self.dirty.clear()
+            return True, b''.join(_record(key, game)
+                                  for key, game in self.games.items())
+        if not self.dirty:
+            return None
+        data = b''.join(_record(key, self.games.get(key))
+                        for key in self.dirty)
+        self.records += len(self.dirty)
+        self.dirty.clear()
+        return False, data
+
+    def write(self, records):
+        """Writes `records`, as returned by collect(), to the file."""
+        if records is None:
+            return
+        snapshot, data = records
+        if not snapshot:
+            self.file.write(data)
+            self._sync()
+            return
+        # Rewrite the file with just the games now tracked.
+        if self.file is not None:
+            self.file.close()
+        tmp = self.path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(MAGIC)
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        self.file = open(self.path, 'ab')
+
+    def snapshot(self):
+        """Rewrites the file with just the games now tracked."""
+        self.records = None
+        self.save()
+
+    def _sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self):
+        if self.file is not None:
+            self.save()
+            self.file.close()
+            self.file = None
+
+def load(path, game_class=Game):
+    """Returns a dict mapping the key of each game in the checkpoint at
+    `path` to the game, as a new `game_class`.  Returns an empty dict if
+    there is no checkpoint."""
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        return {}
+    if not data.startswith(MAGIC):
+        raise ValueError('{} is not a checkpoint file.'.format(path))
+    # Only the last record for each key counts, so just find those
+    # first and build games from them.
+    latest = {}
+    view = memoryview(data)
+    offset = len(MAGIC)
+    end = len(data)
+    while offset + _RECORD.size <= end:
+        kind, key_len, names_len = _RECORD.unpack_from(data, offset)
+        start = offset + _RECORD.size
+        state = start + key_len + names_len
+        if kind == GAME:
+            if state + 2 > end:
+                break
+            next_offset = state + frame_size(view[state:state+2])
+        else:
+            next_offset = state
+        if next_offset > end:
+            break
+        key = bytes(view[start:start+key_len]).decode()
+        latest[key] = (kind, start + key_len, state, next_offset)
+        offset = next_offset
+    games = {}
+    # Building lots of small objects at once sets off the cyclic
+    # garbage collector again and again, for nothing.
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for key, (kind, names, state, next_offset) in latest.items():
+            if kind == GAME:
+                game = game_class(bytes(view[names:state]).decode().split('\n'))
+                apply(game, view[state:next_offset])
+                games[key] = game
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    return games
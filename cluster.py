@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Splits very large tournaments into shards and farms them out to
+workers, which can be on any machine that can reach the coordinator.
+
+The coordinator listens for workers and hands each one a shard at a
+time; workers connect with connect.Connection, play their shard with
+tournament.play_batch and send back its Results, which the coordinator
+merges as they arrive.  The protocol is CRLF-terminated lines:
+
+    SHARD <id> <seed> <start> <count> <strategy>...   (to a worker)
+    QUIT                                              (to a worker)
+    RESULT <id> <results as JSON>                     (from a worker)
+
+If a worker disconnects, or takes longer than the timeout over a shard,
+the shard is put back in the queue for another worker.  A shard's games
+are determined by the seed and their numbers alone, so the Results are
+the same however the shards were spread about, and if a shard ends up
+being played twice only the first result is kept.
+
+To run a job on this machine only:
+
+    python cluster.py coordinate 1000000 --workers 8
+
+or to start a coordinator and add workers from elsewhere:
+
+    python cluster.py coordinate 1000000 --host 0.0.0.0 --port 7777
+    python cluster.py worker coordinator.example.com 7777
+"""
+
+from argparse import ArgumentParser
+from collections import deque
+from selectors import DefaultSelector, EVENT_READ
+from socket import socket, AF_INET, SOCK_STREAM
+from subprocess import Popen, DEVNULL
+import json
+import os
+import sys
+import time
+
+from connect import Connection, LineBuffer, LineTooLongError
+from tournament import Results, greedy, random_strategy, play_batch
+
+# Results carry a histogram per seat, so can be much longer than the
+# lines the game protocol expects.
+MAX_LINE = 1 << 20
+
+STRATEGIES = {
+    'greedy': greedy,
+    'random_strategy': random_strategy
+}
+
+def get_strategy(name):
+    """Returns the strategy called `name`.  'optimal' is the solver's
+    strategy, which needs the value table to have been saved on the
+    worker's machine."""
+    if name == 'optimal' and name not in STRATEGIES:
+        from solver import Strategy
+        STRATEGIES[name] = Strategy()
+    return STRATEGIES[name]
+
+class _Worker:
+
+    def __init__(self, sock, addr):
+        self.sock = sock
+        self.addr = addr
+        self.buffer = LineBuffer(MAX_LINE)
+        self.shard = None
+        self.since = None
+
+    def send(self, line):
+        self.sock.sendall('{}\r\n'.format(line).encode())
+
+class Coordinator:
+
+    """Plays `games` games between the strategies named in `names`,
+    `shard_size` games to a shard, on whatever workers connect.  A
+    worker that has held a shard for more than `timeout` seconds is
+    dropped (by default, workers can take as long as they like).  Local
+    workers that exit early are started again, up to `max_restarts`
+    times in all."""
+
+    def __init__(self, names, games, seed=0, shard_size=1000, timeout=None,
+                 max_restarts=10):
+        self.names = list(names)
+        self.seed = seed
+        self.timeout = timeout
+        self.max_restarts = max_restarts
+        self.restarts = 0
+        self.shards = {i: (start, min(shard_size, games - start))
+                       for i, start in enumerate(range(0, games, shard_size))}
+        self.pending = deque(self.shards)
+        self.done = set()
+        self.results = Results(self.names)
+        self.workers = {}
+        self.selector = DefaultSelector()
+        self.address = None
+
+    def spawn_worker(self):
+        """Starts a worker process on this machine."""
+        host, port = self.address
+        return Popen([sys.executable, os.path.abspath(__file__), 'worker',
+                      host, str(port)], stdout=DEVNULL)
+
+    def run(self, host='localhost', port=0, local_workers=0, progress=None):
+        """Listens for workers on (`host`, `port`), starting
+        `local_workers` of them on this machine, and returns the Results
+        once every shard is done.  `progress`, if given, is called with
+        the Results so far each time a shard comes in."""
+        listener = socket(AF_INET, SOCK_STREAM)
+        listener.bind((host, port))
+        listener.listen()
+        self.address = listener.getsockname()
+        self.selector.register(listener, EVENT_READ)
+        processes = [self.spawn_worker() for _ in range(local_workers)]
+        try:
+            while len(self.done) < len(self.shards):
+                for key, _ in self.selector.select(timeout=1):
+                    if key.fileobj is listener:
+                        self._accept(listener)
+                    else:
+                        self._read(key.data, progress)
+                self._check_timeouts()
+                self._check_processes(processes)
+        finally:
+            for worker in list(self.workers.values()):
+                try:
+                    worker.send('QUIT')
+                except OSError:
+                    pass
+                self._drop(worker)
+            self.selector.unregister(listener)
+            listener.close()
+            for p in processes:
+                p.wait()
+        return self.results
+
+    def _accept(self, listener):
+        sock, addr = listener.accept()
+        worker = _Worker(sock, addr)
+        self.workers[sock] = worker
+        self.selector.register(sock, EVENT_READ, worker)
+        self._dispatch()
+
+    def _dispatch(self):
+        # Give a shard to each idle worker, for as long as there are any
+        # shards to give out.
+        for worker in list(self.workers.values()):
+            while worker.shard is None and self.pending:
+                shard = self.pending.popleft()
+                if shard in self.done:
+                    continue
+                start, count = self.shards[shard]
+                worker.shard = shard
+                worker.since = time.monotonic()
+                try:
+                    worker.send('SHARD {} {} {} {} {}'.format(
+                        shard, self.seed, start, count, ' '.join(self.names)))
+                except OSError:
+                    self._drop(worker)
+                    break
+
+    def _read(self, worker, progress):
+        try:
+            if not worker.buffer.recv_from(worker.sock):
+                raise ConnectionResetError
+            line = worker.buffer.next_line()
+            while line is not None:
+                self._handle(worker, line.decode(), progress)
+                line = worker.buffer.next_line()
+        except (OSError, LineTooLongError, ValueError, KeyError):
+            self._drop(worker)
+        self._dispatch()
+
+    def _handle(self, worker, line, progress):
+        command, shard, data = line.split(' ', 2)
+        if command != 'RESULT':
+            raise ValueError('Unexpected message: {}'.format(line))
+        shard = int(shard)
+        if shard not in self.done:
+            self.results.merge(Results.from_dict(json.loads(data)))
+            self.done.add(shard)
+            if progress is not None:
+                progress(self.results)
+        if worker.shard == shard:
+            worker.shard = None
+
+    def _drop(self, worker):
+        """Disconnects `worker`, putting any shard it had back in the
+        queue."""
+        if worker.shard is not None and worker.shard not in self.done:
+            self.pending.appendleft(worker.shard)
+        worker.shard = None
+        if self.workers.pop(worker.sock, None) is not None:
+            self.selector.unregister(worker.sock)
+        worker.sock.close()
+
+    def _check_processes(self, processes):
+        # A local worker should only exit once it is told to QUIT, so
+        # any that has exited before then has crashed.
+        for i, p in enumerate(processes):
+            if p.poll() is not None and self.restarts < self.max_restarts:
+                self.restarts += 1
+                processes[i] = self.spawn_worker()
+        if (processes and not self.workers and
+                all(p.poll() is not None for p in processes)):
+            raise RuntimeError('Every local worker has exited, with {} '
+                               'shards still to play.'.format(
+                                   len(self.shards) - len(self.done)))
+
+    def _check_timeouts(self):
+        if self.timeout is None:
+            return
+        now = time.monotonic()
+        for worker in list(self.workers.values()):
+            if worker.shard is not None and now - worker.since > self.timeout:
+                self._drop(worker)
+        self._dispatch()
+
+def _handle_shard(line):
+    command, _, args = line.partition(' ')
+    if command == 'QUIT':
+        return False
+    if command != 'SHARD':
+        return None
+    shard, seed, start, count, *names = args.split()
+    strategies = [get_strategy(n) for n in names]
+    results = play_batch((strategies, int(seed), int(start), int(count)))
+    return 'RESULT {} {}'.format(shard, json.dumps(results.to_dict()))
+
+def work(host, port, retry=10):
+    """Connects to the coordinator at (`host`, `port`), trying for up
+    to `retry` seconds, and plays shards until it says to stop."""
+    deadline = time.monotonic() + retry
+    while True:
+        try:
+            Connection(host, port, _handle_shard, max_line=MAX_LINE)
+            return
+        except ConnectionRefusedError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.5)
+
+if __name__ == '__main__':
+
+    parser = ArgumentParser(description='Run a tournament on many workers.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    coordinate = commands.add_parser('coordinate')
+    coordinate.add_argument('games', type=int)
+    coordinate.add_argument('--strategies', nargs='+',
+                            default=['greedy', 'random_strategy'])
+    coordinate.add_argument('--seed', type=int, default=0)
+    coordinate.add_argument('--shard-size', type=int, default=1000)
+    coordinate.add_argument('--timeout', type=float)
+    coordinate.add_argument('--host', default='localhost')
+    coordinate.add_argument('--port', type=int, default=0)
+    coordinate.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='number of workers to start on this machine')
+    worker = commands.add_parser('worker')
+    worker.add_argument('host')
+    worker.add_argument('port', type=int)
+    args = parser.parse_args()
+
+    if args.command == 'worker':
+        work(args.host, args.port)
+    else:
+        start = time.perf_counter()
+        coordinator = Coordinator(args.strategies, args.games, args.seed,
+                                  args.shard_size, args.timeout)
+        results = coordinator.run(args.host, args.port, args.workers)
+        print(results.summary())
+        print('{:.0f} games/s'.format(
+              args.games / (time.perf_counter() - start)))
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Drop-in replacements for Dice, Scorecard and Player that keep their
+state in a few integers, for servers holding many games in memory.
+
+CompactDice packs all five values, the hold mask and the roll count
+into a single int, laid out like the dice word in wire.py.
+CompactScorecard keeps a bitmask of filled categories and an array of
+13 shorts instead of two dicts.  CompactGame is a Game that uses them."""
+
+from array import array
+from collections import Counter
+
+from game import (Game, AlreadyScoredError, NoScore, CATEGORIES, CAT_INDEX,
+                  UPPER_SECTION, SCORE_TABLE, filled_flags, FULL_CARD,
+                  roll_index)
+from rng import default_rng
+
+_VALUE_BITS = 0x7fff
+_HOLD_SHIFT = 15
+_HOLD_BITS = 0x1f << _HOLD_SHIFT
+_ROLLED_SHIFT = 20
+_N_UPPER = len(UPPER_SECTION)
+
+class CompactDice:
+
+    """Five dice, stored in the bits of `word`: die i's value in bits
+    3i to 3i+2, whether it is held in bit 15+i, and the number of times
+    the dice have been rolled in bits 20-21."""
+
+    __slots__ = ('word', 'rng')
+
+    def __init__(self, values=None, rng=None):
+        self.rng = default_rng if rng is None else rng
+        if values is None:
+            values = range(1, 6)
+        word = 0
+        for i, v in enumerate(values):
+            word |= v << 3*i
+        self.word = word
+
+    @property
+    def rolled(self):
+        return self.word >> _ROLLED_SHIFT
+
+    @rolled.setter
+    def rolled(self, n):
+        self.word = self.word & (_VALUE_BITS | _HOLD_BITS) | n << _ROLLED_SHIFT
+
+    def is_held(self, i):
+        return bool(self.word >> _HOLD_SHIFT+i & 1)
+
+    def roll(self):
+        word = self.word
+        faces = iter(self.rng.faces(5 - bin(word & _HOLD_BITS).count('1')))
+        values = 0
+        for i in range(5):
+            if word >> _HOLD_SHIFT+i & 1:
+                values |= word & 7 << 3*i
+            else:
+                values |= next(faces) << 3*i
+        # As with Dice, holds only last for one roll.
+        self.word = values | (self.rolled + 1) << _ROLLED_SHIFT
+
+    def hold(self, indices):
+        """Takes a sequence of indices, and marks the die at each index
+        as being held.  Remember that 0 is the first die."""
+        for i in indices:
+            self.word |= 1 << _HOLD_SHIFT+i
+
+    def toggle(self, i):
+        self.word ^= 1 << _HOLD_SHIFT+i
+
+    def release(self):
+        self.word &= ~_HOLD_BITS
+
+    @property
+    def held(self):
+        word = self.word
+        return [i for i in range(5) if word >> _HOLD_SHIFT+i & 1]
+
+    @property
+    def count(self):
+        return Counter(self.values)
+
+    @property
+    def values(self):
+        word = self.word
+        return [word >> 3*i & 7 for i in range(5)]
+
+    @property
+    def total(self):
+        return sum(self.values)
+
+    @property
+    def index(self):
+        """The index of the current roll in ROLLS."""
+        return roll_index(self.values)
+
+class CompactScorecard:
+
+    """A score card for a single player, held as a bitmask of filled
+    categories and an array of their scores."""
+
+    __slots__ = ('filled', 'points')
+
+    UPPER_SECTION = UPPER_SECTION
+    CATEGORIES = CATEGORIES
+
+    def __init__(self):
+        self.filled = 0
+        self.points = array('h', bytes(2 * len(CATEGORIES)))
+
+    def handle_score(self, score, cat, preview=False):
+        if not preview:
+            i = CAT_INDEX[cat]
+            if self.filled >> i & 1:
+                raise AlreadyScoredError('Player has already entered score for this category.')
+            self.points[i] = score
+            self.filled |= 1 << i
+        return score
+
+    def is_filled(self, cat):
+        return bool(self.filled >> CAT_INDEX[cat] & 1)
+
+    def set_scores(self, filled, points):
+        self.filled = filled
+        for i in range(len(CATEGORIES)):
+            self.points[i] = points[i] if filled >> i & 1 else 0
+
+    def score(self, cat, dice, preview=False):
+        try:
+            return self._score(cat, dice, preview)
+        except AlreadyScoredError:
+            pass
+
+    def _score(self, cat, dice, preview=False):
+        score = SCORE_TABLE[dice.index][CAT_INDEX[cat]]
+        return self.handle_score(score, cat, preview)
+
+    def score_all(self, dice):
+        return SCORE_TABLE[dice.index]
+
+    def preview(self, dice):
+        return SCORE_TABLE[dice.index], filled_flags(self.filled)
+
+    @property
+    def scores(self):
+        """The scores as a dict, as in Scorecard (but a new dict each
+        time, so changing it does not change the scorecard)."""
+        return {c: self.points[i] if self.filled >> i & 1 else NoScore
+                for i, c in enumerate(CATEGORIES)}
+
+    @property
+    def upper_score(self):
+        return sum(self.points[:_N_UPPER])
+
+    @property
+    def bonus(self):
+        return 35 if self.upper_score >= 63 else 0
+
+    @property
+    def total(self):
+        return sum(self.points) + self.bonus
+
+    @property
+    def is_full(self):
+        return self.filled == FULL_CARD
+
+class CompactPlayer:
+
+    __slots__ = ('name', 'rolled', 'scorecard')
+
+    def __init__(self, name):
+        self.name = name
+        self.rolled = False
+        self.scorecard = CompactScorecard()
+
+class CompactGame(Game):
+
+    player_class = CompactPlayer
+    dice_class = CompactDice
@@ -3,16 +3,99 @@
 
 from socket import socket, AF_INET, SOCK_STREAM
 
+MAX_LINE = 1024
+CHUNK_SIZE = 16384
+
+class LineTooLongError(Exception): pass
+
+class LineBuffer:
+    
+    """Splits a stream of bytes into CRLF-terminated lines.
+    
+    Data is read in large chunks straight into a fixed-size bytearray,
+    and each complete line is copied out of it exactly once.  Any number
+    of lines can arrive in one chunk, and a line can be split over any
+    number of chunks.  A line longer than `max_line` bytes raises
+    LineTooLongError, rather than growing the buffer without limit."""
+    
+    def __init__(self, max_line=MAX_LINE, chunk_size=CHUNK_SIZE):
+        self.max_line = max_line
+        self.buf = bytearray(max_line + 2 + chunk_size)
+        self.start = 0  # start of the first incomplete line
+        self.end = 0    # end of the data received so far
+        self.scan = 0   # where to resume looking for a CRLF
+    
+    def _make_room(self):
+        # Move any partial line to the front of the buffer, so there is
+        # at least chunk_size bytes free after it.
+        if self.start == 0:
+            return
+        n = self.end - self.start
+        self.buf[:n] = self.buf[self.start:self.end]
+        self.scan -= self.start
+        self.start = 0
+        self.end = n
+    
+    def recv_from(self, sock):
+        """Reads whatever `sock` has available (blocking until there is
+        something) into the buffer.  Returns the number of bytes read,
+        which is 0 if the connection has been closed."""
+        self._make_room()
+        with memoryview(self.buf) as view:
+            n = sock.recv_into(view[self.end:])
+        self.end += n
+        return n
+    
+    def feed(self, data):
+        """Adds `data` to the buffer, for when it has already been read
+        from some other source.  Returns any lines it completes."""
+        lines = []
+        data = memoryview(data)
+        while data:
+            self._make_room()
+            n = min(len(data), len(self.buf) - self.end)
+            self.buf[self.end:self.end+n] = data[:n]
+            self.end += n
+            data = data[n:]
+            line = self.next_line()
+            while line is not None:
+                lines.append(line)
+                line = self.next_line()
+        return lines
+    
+    def next_line(self):
+        """Returns the next complete line without its CRLF, as bytes, or
+        None if there isn't one yet."""
+        i = self.buf.find(b'\r\n', self.scan, self.end)
+        if i < 0:
+            # The last byte may be the CR of a CRLF split over reads.
+            self.scan = max(self.start, self.end - 1)
+            if self.end - self.start > self.max_line + 1:
+                raise LineTooLongError('Line longer than {} bytes.'.format(
+                                        self.max_line))
+            return None
+        if i - self.start > self.max_line:
+            raise LineTooLongError('Line longer than {} bytes.'.format(
+                                    self.max_line))
+        with memoryview(self.buf) as view:
+            line = bytes(view[self.start:i])
+        self.start = self.scan = i + 2
+        if self.start == self.end:
+            self.start = self.scan = self.end = 0
+        return line
+
 class Connection:
     
-    def __init__(self, host, port, callback, listener=False):
+    def __init__(self, host, port, callback, listener=False,
+                 max_line=MAX_LINE):
         self.host = host
         self.port = port
+        self.callback = callback
         self.socket = socket(AF_INET, SOCK_STREAM)
+        self.buffer = LineBuffer(max_line)
         if listener:
-            # after a while this class will never have to listen;
-            # listening will be done at server level and will probably
-            # use Twisted or similar
+            # this only ever serves a single peer; use server.Server
+            # to host many games from one process
             self.listen()
         else:
             self.connect()
@@ -24,22 +107,41 @@ class Connection:
         self.conn, self.addr = self.socket.accept()
     
     def connect(self):
-        self.socket.connect((host, port))
+        self.socket.connect((self.host, self.port))
         self.conn = self.socket
     
+    def mainloop(self):
+        """Passes each line received to the callback, sending back
+        whatever it returns (unless that is None), until the connection
+        is closed or the callback returns False."""
+        line = self.receive()
+        while line is not None:
+            reply = self.callback(line)
+            if reply is False:
+                break
+            if reply is not None:
+                self.send(reply)
+            line = self.receive()
+        self.close()
+    
+    def close(self):
+        self.conn.close()
+        if self.conn is not self.socket:
+            self.socket.close()
+    
     def send(self, data):
-        self.conn.send('{}\r\n'.format(data.encode()))
+        self.conn.sendall('{}\r\n'.format(data).encode())
     
     def receive(self):
-        buf = []
-        while buf[-2:] != [b'\r', b'\n']:
-            c = self.conn.recv(1)
-            if not c:
+        """Returns the next line received, or None if the connection
+        has been closed."""
+        line = self.buffer.next_line()
+        while line is None:
+            if not self.buffer.recv_from(self.conn):
                 self.handle_connection_closed()
-            buf.append(c)
-        line = b''.join(buf[:-2]).decode()
-        print('received:', line)
-        return line
+                return None
+            line = self.buffer.next_line()
+        return line.decode()
 
     def handle_connection_closed(self):
         print('connection closed.')
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Works out the exact probability distribution of a player's final
+score, from any point in their game, when they play the optimal
+strategy of solver.py from then on.
+
+Probability mass is pushed forward from the player's current state
+through every state they could reach, one turn at a time.  At each
+state, it is held as a float32 array with one row for each upper
+section total the player could have there and one column for each
+score they could have gained since the start, so the arrays only
+cover what is actually reachable; a state's array is dropped once its
+mass has been passed on.
+
+The distributions are used for percentiles and for the chances of one
+player beating another (their games being independent).
+
+Early in a game there are far more states ahead, and working out a
+distribution from scratch can take a minute or more.  So those from
+every state with at most a few categories filled can be worked out
+ahead of time and saved next to the value table:
+
+    python distribution.py [MAX_FILLED]
+
+after which ScoreDistribution just reads them.  Anything else that may
+take a while can be asked for with ScoreDistribution.submit(), which
+works it out on a background thread instead of blocking the caller."""
+
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from itertools import combinations
+from multiprocessing import Pool
+from os.path import dirname, exists, join
+from sys import argv
+import time
+
+import numpy as np
+
+from game import UPPER_SECTION
+from solver import (ROLL_PROBS, SCORES, FULL, BONUS, BONUS_THRESHOLD,
+                    DEFAULT_PATH, N_CATS, category_values, transitions,
+                    roll_keeps, state, load)
+
+DEFAULT_TABLE_PATH = join(dirname(DEFAULT_PATH), 'distributions.npz')
+
+N_UPPER = len(UPPER_SECTION)
+MAX_SCORES = SCORES.max(axis=0)
+
+@lru_cache(maxsize=None)
+def _upper_sums(upper_mask):
+    """The possible totals of the upper categories in `upper_mask`."""
+    sums = {0}
+    for c in range(N_UPPER):
+        if upper_mask >> c & 1:
+            sums = {t + k * (c+1) for t in sums for k in range(6)}
+    return sums
+
+@lru_cache(maxsize=4096)
+def _rows(new_upper_mask, upper):
+    """The upper totals a player at `upper` could reach by filling the
+    upper categories in `new_upper_mask`, capped at the threshold."""
+    return np.array(sorted({min(BONUS_THRESHOLD, upper + t)
+                            for t in _upper_sums(new_upper_mask)}))
+
+def turn_outcomes(values, mask, rows):
+    """Returns an array whose [u, c, s] entry is the probability that a
+    player playing optimally from state (mask, rows[u]) scores s in
+    category c this turn."""
+    t = transitions()
+    keeps = roll_keeps()
+    n_rows = len(rows)
+    cols = np.arange(n_rows)
+    cat = category_values(values, mask, rows)
+    chosen = cat.argmax(axis=1)
+    best = np.take_along_axis(cat, chosen[:, None], 1)[:, 0]
+    # For each roll, the keep chosen after the second and first rolls
+    # (worked out backwards, as the first depends on the second)
+    # (These arrays are indexed [u, roll, hold], so that argmax runs
+    # along contiguous memory.)
+    rolls = np.arange(len(keeps))
+    choices = (t @ best).T[:, keeps]
+    pick = choices.argmax(axis=2)
+    keep2 = keeps[rolls, pick].T
+    k1 = t @ np.take_along_axis(choices, pick[:, :, None], 2)[:, :, 0].T
+    keep1 = keeps[rolls, k1.T[:, keeps].argmax(axis=2)].T
+    roll = np.repeat(ROLL_PROBS[:, None], n_rows, axis=1)
+    for keep in (keep1, keep2):
+        mass = np.bincount((keep * n_rows + cols).ravel(), roll.ravel(),
+                           t.shape[0] * n_rows).reshape(-1, n_rows)
+        roll = t.T @ mass
+    score = np.take_along_axis(SCORES, chosen.reshape(len(SCORES), -1), 1)
+    index = (cols * N_CATS + chosen) * 51 + score
+    return np.bincount(index.ravel(), roll.ravel(),
+                       n_rows * N_CATS * 51).reshape(n_rows, N_CATS, 51)
+
+class ScoreDistribution:
+
+    """Works out score distributions using the value table `values`
+    (or the one saved at `path`).  Distributions of the score still to
+    come from each state queried are kept in an LRU cache, since a
+    player's state changes only once a turn, and any saved by
+    precompute() to `table_path` are read from there instead."""
+
+    def __init__(self, values=None, path=DEFAULT_PATH, cache_size=256,
+                 table_path=DEFAULT_TABLE_PATH):
+        values = load(path) if values is None else values
+        # Indexing a plain array is quicker than indexing a memmap.
+        self.values = np.asarray(values)
+        # An npz file only reads the arrays that are asked for.
+        self.table = np.load(table_path) if exists(table_path) else {}
+        self.remaining = lru_cache(maxsize=cache_size)(self._remaining)
+        self.executor = None
+
+    def _remaining(self, mask, upper):
+        """Returns an array whose k'th item is the probability of
+        scoring k more points (including any bonus) from state (mask,
+        upper)."""
+        key = _key(mask, upper)
+        if key in self.table:
+            return self.table[key]
+        start = mask
+        states = {mask: np.ones((1, 1), dtype=np.float32)}
+        # Each turn fills one category, so going through the states a
+        # turn at a time means a state's mass is complete before it is
+        # needed, and only two turns' states are held at once.
+        free = [c for c in range(N_CATS) if not mask >> c & 1]
+        for n in range(len(free)):
+            layer = {}
+            for filled in combinations(free, n):
+                m = start | sum(1 << c for c in filled)
+                dist = states.pop(m, None)
+                if dist is None:
+                    continue
+                self._push(m, start, upper, dist, layer)
+            states = layer
+        dist = states[FULL]
+        return dist.sum(axis=0, dtype=np.float64)
+
+    def _push(self, mask, start, upper, dist, layer):
+        rows = _rows((mask & ~start) & (1 << N_UPPER) - 1, upper)
+        outcomes = turn_outcomes(self.values, mask, rows)
+        for c in range(N_CATS):
+            if mask >> c & 1:
+                continue
+            m = mask | 1 << c
+            new_rows = _rows((m & ~start) & (1 << N_UPPER) - 1, upper)
+            if m not in layer:
+                layer[m] = np.zeros((len(new_rows),
+                                     dist.shape[1] + MAX_SCORES[c]
+                                     + (BONUS if c < N_UPPER else 0)),
+                                    dtype=np.float32)
+            dest = layer[m]
+            width = dist.shape[1]
+            for s in np.flatnonzero(outcomes[:, c].any(axis=0)):
+                moved = outcomes[:, c, s, None] * dist
+                if c < N_UPPER:
+                    new_upper = np.minimum(BONUS_THRESHOLD, rows + s)
+                    bonus = (rows < BONUS_THRESHOLD) & (new_upper >= BONUS_THRESHOLD)
+                    pos = np.searchsorted(new_rows, new_upper)
+                    for b in (False, True):
+                        sel = np.flatnonzero(bonus == b)
+                        if len(sel):
+                            # Several rows can land on the capped total,
+                            # so add them up with a 0/1 matrix.
+                            into = np.zeros((len(new_rows), len(sel)),
+                                            dtype=np.float32)
+                            into[pos[sel], np.arange(len(sel))] = 1
+                            shift = s + BONUS * b
+                            dest[:, shift:shift+width] += into @ moved[sel]
+                else:
+                    # The upper total doesn't change, so nor do the rows.
+                    dest[:, s:s+width] += moved
+
+    def final(self, scorecard):
+        """Returns an array whose k'th item is the probability that
+        `scorecard` ends with a total of k."""
+        dist = self.remaining(*state(scorecard))
+        return np.concatenate([np.zeros(int(scorecard.total)), dist])
+
+    def submit(self, scorecard):
+        """Starts working out final(scorecard) on a background thread,
+        and returns a concurrent.futures.Future for it.  The scorecard
+        may change meanwhile, as its state is taken straight away."""
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(1)
+        mask, upper = state(scorecard)
+        total = int(scorecard.total)
+        def work():
+            dist = self.remaining(mask, upper)
+            return np.concatenate([np.zeros(total), dist])
+        return self.executor.submit(work)
+
+def _key(mask, upper):
+    return '{}_{}'.format(mask, upper)
+
+def early_states(max_filled):
+    """Returns every (mask, upper) state a player can be in with at
+    most `max_filled` categories filled."""
+    states = []
+    for n in range(max_filled + 1):
+        for filled in combinations(range(N_CATS), n):
+            mask = sum(1 << c for c in filled)
+            for upper in sorted(_rows(mask & (1 << N_UPPER) - 1, 0)):
+                states.append((mask, int(upper)))
+    return states
+
+_worker = None
+
+def _init_worker(path):
+    global _worker
+    # Not from a saved table, which is what's being made.
+    _worker = ScoreDistribution(path=path, cache_size=0, table_path='')
+
+def _work_out(s):
+    return s, _worker.remaining(*s)
+
+def precompute(max_filled=1, path=DEFAULT_PATH, table_path=DEFAULT_TABLE_PATH,
+               processes=None, verbose=False):
+    """Works out the distribution from every state with at most
+    `max_filled` categories filled, on a pool of worker processes, and
+    saves them to `table_path` for ScoreDistribution to read."""
+    states = early_states(max_filled)
+    table = {}
+    with Pool(processes, _init_worker, (path,)) as pool:
+        for s, dist in pool.imap_unordered(_work_out, states):
+            table[_key(*s)] = dist
+            if verbose:
+                print('{} of {} states done'.format(len(table), len(states)))
+    np.savez(table_path, **table)
+
+def mean(dist):
+    return float(np.arange(len(dist)) @ dist)
+
+def percentiles(dist, qs=(5, 25, 50, 75, 95)):
+    """Returns the final score at each percentile in `qs`."""
+    cumulative = np.cumsum(dist)
+    return [int(np.searchsorted(cumulative, q / 100)) for q in qs]
+
+def win_probability(dist_a, dist_b):
+    """Returns the probabilities that a player whose final score is
+    distributed as `dist_a` beats, draws with and loses to one whose
+    score is distributed as `dist_b`."""
+    n = max(len(dist_a), len(dist_b))
+    a = np.pad(dist_a, (0, n - len(dist_a)))
+    b = np.pad(dist_b, (0, n - len(dist_b)))
+    below_b = np.cumsum(b) - b
+    win = float(a @ below_b)
+    draw = float(a @ b)
+    return win, draw, max(0.0, 1 - win - draw)
+
+if __name__ == '__main__':
+
+    max_filled = int(argv[1]) if len(argv) > 1 else 1
+    start = time.perf_counter()
+    precompute(max_filled, verbose=True)
+    print('Done in {:.1f}s; saved to {}'.format(time.perf_counter() - start,
+                                               DEFAULT_TABLE_PATH))
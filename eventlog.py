@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""An append-only binary log of everything that happens in any number
+of games, and a reader that can replay any one of them.
+
+Each event is one fixed-size 9-byte record: the game's id (4 bytes),
+the kind of event (1 byte) and its data (4 bytes):
+
+    NEW     number of players
+    ROLL    the dice word (as in wire.py) after the roll
+    HOLD    the dice word after the change of holds
+    SCORE   player << 24 | category index << 16 | score
+    TURN    the index of the player whose turn it now is
+    OVER    the index of the player after the last to play
+
+EventLog collects records in memory and writes them in batches.
+LogReader memory-maps the log.  The first time a game is asked for, it
+reads the column of game ids once to index the records by game; after
+that, replaying a game only reads the pages holding its records."""
+
+from mmap import mmap, ACCESS_READ
+from struct import Struct
+
+import numpy as np
+
+from game import Game, CATEGORIES, CAT_INDEX
+from wire import pack_dice, unpack_dice
+
+NEW, ROLL, HOLD, SCORE, TURN, OVER = range(6)
+
+_RECORD = Struct('<IBI')
+RECORD_DTYPE = np.dtype([('game', '<u4'), ('kind', 'u1'), ('data', '<u4')])
+
+def _roll_data(game):
+    return pack_dice(game.dice)
+
+def _hold_data(game, indices):
+    return pack_dice(game.dice)
+
+def _score_data(game, player_i, cat, score):
+    return player_i << 24 | CAT_INDEX[cat] << 16 | score
+
+def _turn_data(game, player_i):
+    return player_i
+
+def _over_data(game):
+    return game._player_i
+
+_EVENTS = {
+    'roll': (ROLL, _roll_data),
+    'hold': (HOLD, _hold_data),
+    'score': (SCORE, _score_data),
+    'turn': (TURN, _turn_data),
+    'over': (OVER, _over_data)
+}
+
+class EventLog:
+
+    """Appends the events of every attached game to the file at
+    `path`.  Records are buffered and written once `batch_size` bytes
+    have built up, or on flush() or close().
+
+    Game ids are given out from `first_id` upwards.  By default that is
+    one more than the id of the last game started in the log, so that
+    reopening an existing log carries on from where it left off."""
+
+    def __init__(self, path, batch_size=65536, first_id=None):
+        if first_id is None:
+            first_id = _next_id(path)
+        self.file = open(path, 'ab')
+        # Drop any record cut short by a crash, which would otherwise
+        # put every record after it out of line.
+        size = self.file.tell()
+        self.file.truncate(size - size % _RECORD.size)
+        self.batch_size = batch_size
+        self.buffer = bytearray()
+        self.next_id = first_id
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def attach(self, game):
+        """Starts logging `game`'s events, and returns its id."""
+        game_id = self.next_id
+        self.next_id += 1
+        self.record(game_id, NEW, len(game.players))
+        def listener(game, event, *args):
+            kind, data = _EVENTS[event]
+            self.record(game_id, kind, data(game, *args))
+        game.listeners.append(listener)
+        return game_id
+
+    def record(self, game_id, kind, data):
+        self.buffer += _RECORD.pack(game_id, kind, data)
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        self.file.write(self.buffer)
+        self.file.flush()
+        self.buffer.clear()
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+def _next_id(path, chunk=4096):
+    """Returns one more than the id of the last game started in the log
+    at `path`, or 0 if there is no log or no game in it.  Ids are given
+    out in order, so that's the highest, and only the end of the log
+    has to be read to find it."""
+    try:
+        reader = LogReader(path)
+    except FileNotFoundError:
+        return 0
+    with reader:
+        end = len(reader.records)
+        while end > 0:
+            start = max(0, end - chunk)
+            new = np.flatnonzero(reader.records['kind'][start:end] == NEW)
+            if len(new):
+                return int(reader.records['game'][start + new[-1]]) + 1
+            end = start
+    return 0
+
+class LogReader:
+
+    """Reads a log written by EventLog.  `records` is a structured
+    numpy array (with fields 'game', 'kind' and 'data') backed directly
+    by the memory-mapped file."""
+
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        count = self._count()
+        if count:
+            self.map = mmap(self.file.fileno(), 0, access=ACCESS_READ)
+            self.records = np.frombuffer(self.map, RECORD_DTYPE, count)
+        else:
+            # An empty file can't be mapped.
+            self.map = None
+            self.records = np.zeros(0, RECORD_DTYPE)
+        # The positions of the records sorted by game (and, within a
+        # game, in the order they happened), and the game of each
+        self._order = self._ids = None
+
+    def _count(self):
+        self.file.seek(0, 2)
+        return self.file.tell() // RECORD_DTYPE.itemsize
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        # The array must let go of the map before the map can close.
+        del self.records
+        if self.map is not None:
+            self.map.close()
+        self.file.close()
+
+    def games(self):
+        """Returns the ids of all the games in the log."""
+        return self.records['game'][self.records['kind'] == NEW]
+
+    def events(self, game_id):
+        """Returns the records of one game, in the order they happened."""
+        if self._order is None:
+            self._order = np.argsort(self.records['game'], kind='stable')
+            self._ids = self.records['game'][self._order]
+        lo = np.searchsorted(self._ids, game_id, 'left')
+        hi = np.searchsorted(self._ids, game_id, 'right')
+        return self.records[self._order[lo:hi]]
+
+    def replay(self, game_id, turns=None, names=None):
+        """Rebuilds a game as it was after `turns` changes of turn (or
+        at the end of the log, if `turns` is None) and returns it.  The
+        players are named '0', '1', etc. unless `names` is given."""
+        game = None
+        for _, kind, data in self.events(game_id).tolist():
+            if kind == NEW:
+                game = Game(names or [str(i) for i in range(data)])
+                if turns is not None and turns <= 0:
+                    break
+            elif kind in (ROLL, HOLD):
+                unpack_dice(data, game.dice)
+            elif kind == SCORE:
+                game.players[data >> 24].scorecard.handle_score(
+                    data & 0xffff, CATEGORIES[data >> 16 & 0xff])
+            elif kind == TURN:
+                game._player_i = data
+                game.dice.release()
+                game.dice.rolled = 0
+                if turns is not None:
+                    turns -= 1
+                    if turns <= 0:
+                        break
+            elif kind == OVER:
+                game._player_i = data
+                game.is_over = True
+        return game
@@ -1,13 +1,27 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import random
 from collections import Counter
+from functools import lru_cache
 from operator import itemgetter
-from itertools import groupby
+from itertools import groupby, combinations_with_replacement
+
+from rng import default_rng
+
+UPPER_SECTION = ['ones', 'twos', 'threes', 'fours', 'fives', 'sixes']
+LOWER_SECTION = ['3x', '4x', 'fh', 'ss', 'ls', 'y', 'c']
+CATEGORIES = UPPER_SECTION + LOWER_SECTION
+CAT_INDEX = {c: i for i, c in enumerate(CATEGORIES)}
+FULL_CARD = (1 << len(CATEGORIES)) - 1
+
+# If True, Scorecard checks its running totals against its scores every
+# time they are read.  Slow; for debugging only.
+DEBUG = False
 
 class AlreadyScoredError(Exception): pass
 
+class IllegalMoveError(Exception): pass
+
 class GameEvent(Exception): pass
 
 class TurnOver(GameEvent):
@@ -45,22 +59,70 @@ class NoScoreType:
     
 NoScore = NoScoreType()
 
+def _longest_run(values):
+    """Returns the length of the longest run of consecutive numbers in
+    the sorted sequence `values`."""
+    longest = 0
+    for k, g in groupby(enumerate(sorted(set(values))), lambda x: x[0]-x[1]):
+        longest = max(longest, len(list(map(itemgetter(1), g))))
+    return longest
+
+def _score_roll(values):
+    """Returns a tuple of the score that the dice `values` would give in
+    each category, in the order of CATEGORIES."""
+    count = Counter(values)
+    counts = set(count.values())
+    total = sum(values)
+    most = max(counts)
+    run = _longest_run(values)
+    return tuple([count[n] * n for n in range(1, 7)] + [
+        total if most >= 3 else 0,      # 3x
+        total if most >= 4 else 0,      # 4x
+        25 if counts == {3, 2} else 0,  # fh
+        30 if run >= 4 else 0,          # ss
+        40 if run >= 5 else 0,          # ls
+        50 if most == 5 else 0,         # y
+        total                           # c
+    ])
+
+# Every possible roll of five dice, as a sorted tuple of values.  There
+# are only 252 of them, so we score each one in every category up front
+# and scoring a roll becomes a lookup in SCORE_TABLE by its index.
+ROLLS = list(combinations_with_replacement(range(1, 7), 5))
+ROLL_INDEX = {r: i for i, r in enumerate(ROLLS)}
+SCORE_TABLE = [_score_roll(r) for r in ROLLS]
+
+@lru_cache(maxsize=None)
+def filled_flags(filled):
+    """Returns which categories are filled, as a tuple of flags in the
+    order of CATEGORIES, for the `filled` bitmask of a Scorecard.  Each
+    bitmask is worked out the first time it is seen, rather than all
+    8192 of them at import."""
+    return tuple(bool(filled >> i & 1) for i in range(len(CATEGORIES)))
+
+def roll_index(values):
+    """Returns the index in ROLLS (and SCORE_TABLE) of the roll with
+    the given dice values, which can be in any order."""
+    return ROLL_INDEX[tuple(sorted(values))]
+
 class Die:
     
     def __init__(self, dice, value=None):
         self.dice = dice
         self.is_held = False
-        self.value = value or random.randint(1, 6)
+        self.value = value or dice.rng.face()
     
     def roll(self):
-        self.value = random.randint(1, 6)
+        self.value = self.dice.rng.face()
         return self.value
 
 class Dice:
     
-    """Represents a set of five dice."""
+    """Represents a set of five dice.  Rolls come from `rng` (an
+    rng.DiceRNG), or from rng.default_rng if it is None."""
     
-    def __init__(self, values=None):
+    def __init__(self, values=None, rng=None):
+        self.rng = default_rng if rng is None else rng
         if values is not None:
             self.dice = [Die(self, i) for i in values]
         else:
@@ -80,13 +142,13 @@ class Dice:
         return val        
 
     def roll(self):
+        free = [d for d in self.dice if not d.is_held]
+        for d, value in zip(free, self.rng.faces(len(free))):
+            d.value = value
         for d in self.dice:
-            if not d.is_held:
-                d.roll()
-            else:
-                # If dice is marked as held, don't roll it, but un-mark
-                # it for future rolls
-                d.is_held = False
+            # Held dice weren't rolled, but un-mark them for future
+            # rolls
+            d.is_held = False
         self.rolled += 1
     
     def hold(self, indices):
@@ -95,6 +157,21 @@ class Dice:
         for i in indices:
             self.dice[i].is_held = True
     
+    def toggle(self, i):
+        """Holds the die at index `i` if it isn't held, or releases it
+        if it is."""
+        self.dice[i].is_held = not self.dice[i].is_held
+
+    def release(self):
+        """Releases all the dice."""
+        for d in self.dice:
+            d.is_held = False
+    
+    @property
+    def held(self):
+        """The indices of the dice that are held."""
+        return [i for i, d in enumerate(self.dice) if d.is_held]
+    
     @property
     def count(self):
         return Counter(d.value for d in self.dice)
@@ -103,6 +180,11 @@ class Dice:
     def values(self):
         return [d.value for d in self.dice]
     
+    @property
+    def index(self):
+        """The index of the current roll in ROLLS."""
+        return roll_index(d.value for d in self.dice)
+    
     @property
     def total(self):
         return sum(d.value for d in self.dice)
@@ -117,108 +199,122 @@ class Player:
 class Scorecard:
     """A score card for a single player."""
     
-    UPPER_SECTION = ['ones', 'twos', 'threes', 'fours', 'fives', 'sixes']
-    LOWER_SECTION = ['3x', '4x', 'fh', 'ss', 'ls', 'y', 'c']
-    CATEGORIES = UPPER_SECTION + LOWER_SECTION
+    UPPER_SECTION = UPPER_SECTION
+    LOWER_SECTION = LOWER_SECTION
+    CATEGORIES = CATEGORIES
     
     def __init__(self):
         self.scores = {c: NoScore for c in self.CATEGORIES}
-        self.SCORE_FUNCS = {
-            'ones': lambda d, p: self.upper(1, d),
-            'twos': lambda d, p: self.upper(2, d),
-            'threes': lambda d, p: self.upper(3, d),
-            'fours': lambda d, p: self.upper(4, d),
-            'fives': lambda d, p: self.upper(5, d),
-            'sixes': lambda d, p: self.upper(6, d),
-            '3x': self.three_kind,
-            '4x': self.four_kind,
-            'fh': self.full_house,
-            'ss': self.short_straight,
-            'ls': self.long_straight,
-            'y': self.yahtzee,
-            'c': self.chance
-        }
+        # Running totals, kept up to date by handle_score so that
+        # reading them doesn't need to go through every category.
+        # `filled` is a bitmask in which bit i is set if CATEGORIES[i]
+        # has been scored.
+        self.filled = 0
+        self._upper = 0
+        self._lower = 0
             
     def handle_score(self, score, cat, preview=False):
         if not preview:
             if self.scores[cat] is not NoScore:
                 raise AlreadyScoredError('Player has already entered score for this category.')
             self.scores[cat] = score
+            i = CAT_INDEX[cat]
+            self.filled |= 1 << i
+            if i < len(self.UPPER_SECTION):
+                self._upper += score
+            else:
+                self._lower += score
         return score
 
+    def is_filled(self, cat):
+        return self.scores[cat] is not NoScore
+
+    def set_scores(self, filled, points):
+        """Overwrites the whole scorecard.  `filled` is a bitmask as for
+        the `filled` attribute and `points` a sequence of scores in the
+        order of CATEGORIES (ignored for categories not filled)."""
+        n_upper = len(self.UPPER_SECTION)
+        totals = [0, 0]
+        scores = self.scores
+        for i, c in enumerate(self.CATEGORIES):
+            if filled >> i & 1:
+                scores[c] = points[i]
+                totals[i >= n_upper] += points[i]
+            else:
+                scores[c] = NoScore
+        self.filled = filled
+        self._upper, self._lower = totals
+
+    def _recount(self):
+        """Works out the running totals from scratch."""
+        filled = 0
+        for i, c in enumerate(self.CATEGORIES):
+            if self.scores[c] is not NoScore:
+                filled |= 1 << i
+        upper = sum(self.scores[c] for c in self.UPPER_SECTION)
+        lower = sum(self.scores[c] for c in self.LOWER_SECTION)
+        return filled, upper, lower
+
+    def check_totals(self):
+        assert (self.filled, self._upper, self._lower) == self._recount(), \
+            'Running totals are out of step with scores.'
+
     def score(self, cat, dice, preview=False):
         try:
-            return self.SCORE_FUNCS[cat](dice, preview)
+            return self._score(cat, dice, preview)
         except AlreadyScoredError:
             pass
     
+    def _score(self, cat, dice, preview=False):
+        score = SCORE_TABLE[dice.index][CAT_INDEX[cat]]
+        return self.handle_score(score, cat, preview)
+    
+    def score_all(self, dice):
+        """Returns a tuple of the score that `dice` would give in each
+        category, in the order of CATEGORIES, regardless of whether the
+        category has already been filled."""
+        return SCORE_TABLE[dice.index]
+    
+    def preview(self, dice):
+        """Returns two tuples in the order of CATEGORIES: the score
+        `dice` would give in each category, and whether each category
+        has already been filled.  Both are looked up in one go, rather
+        than calling score(cat, dice, preview=True) for every category."""
+        return SCORE_TABLE[dice.index], filled_flags(self.filled)
+    
     def upper(self, n, dice, preview=False):
         """This function places scores in the upper section of the
         scorecard.  `n` is the number (1-6) that you want to score."""
-        print(n, dice, preview)
-        if 0 >= n >= 7:
+        if not 1 <= n <= 6:
             raise ValueError('n must be number between 1 and 6.')
-        cat = self.UPPER_SECTION[n-1]
-        print(dice)
-        score = len([d.value for d in dice if d.value == n]) * n
-        return self.handle_score(score, cat, preview)
-    
-    def _kind(self, n, cat, dice, preview=False):
-        """General method for n-of-a-kind rolls."""
-        for c in dice.count.values():
-            if c >= n:
-                score = dice.total
-                break
-        else:
-            score = 0
-        return self.handle_score(score, cat, preview)
+        return self._score(self.UPPER_SECTION[n-1], dice, preview)
     
     def three_kind(self, dice, preview=False):
-        return self._kind(3, '3x', dice, preview)
+        return self._score('3x', dice, preview)
     
     def four_kind(self, dice, preview=False):
-        return self._kind(4, '4x', dice, preview)
+        return self._score('4x', dice, preview)
     
     def full_house(self, dice, preview=False):
-        if set(dice.count.values()) == {3, 2}:
-            score = 25
-        else:
-            score = 0
-        return self.handle_score(score, 'fh', preview)
-    
-    def _straight(self, n, cat, dice, preview=False):
-        if 6 <= n <= 3:
-            raise ValueError('n must be 4 or 5.')
-        values = sorted({d.value for d in dice})
-        for k, g in groupby(enumerate(values), lambda x:x[0]-x[1]):
-            streak = list(map(itemgetter(1), g))
-            if len(streak) >= n:
-                score = 30 if n == 4 else 40
-                break
-        else:
-            score = 0
-        return self.handle_score(score, cat, preview)
+        return self._score('fh', dice, preview)
     
     def short_straight(self, dice, preview=False):
-        return self._straight(4, 'ss', dice, preview)
+        return self._score('ss', dice, preview)
     
     def long_straight(self, dice, preview=False):
-        return self._straight(5, 'ls', dice, preview)
+        return self._score('ls', dice, preview)
     
     def yahtzee(self, dice, preview=False):
-        if len({d.value for d in dice}) == 1:
-            score = 50
-        else:
-            score = 0
-        return self.handle_score(score, 'y', preview)
+        return self._score('y', dice, preview)
     
     def chance(self, dice, preview=False):
-        score = dice.total
-        return self.handle_score(score, 'c', preview)
+        return self._score('c', dice, preview)
 
     @property
     def upper_score(self):
-        return sum(self.scores[c] for c in self.UPPER_SECTION)
+        if DEBUG:
+            self.check_totals()
+        return self._upper
 
     @property
     def bonus(self):
@@ -226,20 +322,43 @@ class Scorecard:
     
     @property
     def total(self):
-        return sum(self.scores.values()) + self.bonus
+        return self.upper_score + self._lower + self.bonus
     
     @property
     def is_full(self):
-        return not (NoScore in self.scores.values())
+        if DEBUG:
+            self.check_totals()
+        return self.filled == FULL_CARD
     
 class Game:
     
-    def __init__(self, player_names):
-        self.players = [Player(p) for p in player_names]
-        self.dice = Dice()
+    player_class = Player
+    dice_class = Dice
+    
+    def __init__(self, player_names, rng=None, rules=None):
+        self.players = [self.player_class(p) for p in player_names]
+        if rules is not None:
+            # A variant (see rules.py); the standard rules need nothing
+            # more than plain Scorecards.
+            for p in self.players:
+                p.scorecard = rules.new_scorecard()
+        self.dice = self.dice_class(rng=rng)
         self.scores = {p.name: p.scorecard for p in self.players}
         self._player_i = 0 # so current player is first in list
         self.is_over = False
+        # Callables notified of every change to the game, as
+        # listener(game, event, *args).  The events are:
+        #   'roll'                       the dice have been rolled
+        #   'hold', indices              the held dice have changed, and
+        #                                are now those at `indices`
+        #   'score', player_i, cat, score  a score has been placed
+        #   'turn', player_i             it is now player_i's turn
+        #   'over'                       the game is over
+        self.listeners = []
+    
+    def notify(self, event, *args):
+        for listener in self.listeners:
+            listener(self, event, *args)
     
     @property
     def current_player(self):
@@ -250,6 +369,50 @@ class Game:
         highest_score = max([s.total for s in self.scores.values()])
         return list(filter(lambda p: p.scorecard.total == highest_score, self.players)), highest_score
     
+    def hints(self, engine):
+        """Returns the hints from `engine` (a hints.HintEngine) for the
+        current player's turn, as (hold_hints, category_hints)."""
+        return engine.hints(self.current_player.scorecard, self.dice)
+    
+    def roll(self):
+        """Rolls the current player's dice, other than those held."""
+        if self.dice.rolled >= 3:
+            raise IllegalMoveError('Player has already rolled three times.')
+        self.dice.roll()
+        self.notify('roll')
+    
+    def hold(self, indices):
+        """Holds the dice at `indices`, and releases any others, for the
+        current player's next roll."""
+        self._check_can_hold()
+        self.dice.release()
+        self.dice.hold(indices)
+        self.notify('hold', self.dice.held)
+    
+    def _check_can_hold(self):
+        if self.dice.rolled < 1:
+            raise IllegalMoveError('Player must roll all five dice first.')
+        if self.dice.rolled >= 3:
+            raise IllegalMoveError('Player has no rolls left.')
+
+    def toggle_hold(self, i):
+        """Holds the die at index `i` for the current player's next
+        roll, or releases it if it is already held."""
+        self._check_can_hold()
+        self.dice.toggle(i)
+        self.notify('hold', self.dice.held)
+    
+    def place_score(self, cat):
+        """Scores the current player's dice in `cat` and moves on to the
+        next player.  Returns the score, and raises GameOver (after
+        scoring) if that was the last turn of the game."""
+        if self.dice.rolled < 1:
+            raise IllegalMoveError('Player has not rolled yet.')
+        score = self.current_player.scorecard._score(cat, self.dice)
+        self.notify('score', self._player_i, cat, score)
+        self.next_player()
+        return score
+    
     def next_player(self):
         if self._player_i < (len(self.players)-1):
             self._player_i += 1
@@ -257,6 +420,10 @@ class Game:
             self._player_i = 0
         if self.current_player.scorecard.is_full:
             self.is_over = True
+            self.notify('over')
             raise GameOver
+        # The next player starts afresh, with nothing held.
+        self.dice.release()
         self.dice.rolled = 0
+        self.notify('turn', self._player_i)
 
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Hints for the player whose turn it is: the final score they can
+expect from each hold and each open category, if they play optimally
+from then on.
+
+The hints come from the solver's value table (see solver.py), so that
+has to have been solved and saved first.  The first query in a given
+scorecard state evaluates the turn, which takes a few milliseconds;
+the results are kept in a bounded LRU cache, so further queries in
+that state (for the rest of the turn, or from other games that reach
+it) are lookups."""
+
+from game import CATEGORIES
+from solver import Strategy, state, transitions, roll_keeps, DEFAULT_PATH
+
+class HintEngine(Strategy):
+
+    def __init__(self, values=None, path=DEFAULT_PATH, cache_size=1024):
+        Strategy.__init__(self, values, path, cache_size)
+        # Build the roll outcome tables now, rather than on the first
+        # query.
+        transitions()
+        roll_keeps()
+
+    def hold_hints(self, scorecard, dice):
+        """Returns a dict mapping each of the 32 possible holds (as a
+        tuple of the indices of the dice held) to the expected final
+        score from making it and rolling the rest.  Empty if the dice
+        haven't been rolled yet or can't be rolled again."""
+        if not 1 <= dice.rolled < 3:
+            return {}
+        total = scorecard.total
+        return {tuple(i for i in range(5) if s >> i & 1): total + v
+                for s, v in enumerate(self._hold_values(scorecard, dice))}
+
+    def category_hints(self, scorecard, dice):
+        """Returns a dict mapping each open category to the expected
+        final score from scoring the dice in it now."""
+        if dice.rolled < 1:
+            return {}
+        cat = self._turn(*state(scorecard))[0][dice.index]
+        total = scorecard.total
+        return {c: total + float(cat[i]) for i, c in enumerate(CATEGORIES)
+                if not scorecard.is_filled(c)}
+
+    def hints(self, scorecard, dice):
+        """Returns (hold_hints, category_hints)."""
+        return (self.hold_hints(scorecard, dice),
+                self.category_hints(scorecard, dice))
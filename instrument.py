@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Opt-in call counts and latency histograms for the hot paths of the
+game, the presenter and the network transport.
+
+Nothing is measured until enable() is called, which wraps each of the
+methods in TARGETS with a timing wrapper; disable() puts the original
+methods back, so there is no cost at all while instrumentation is off.
+
+    import instrument
+    instrument.enable()
+    ...
+    print(instrument.to_prometheus())
+
+The figures can be written out every so often with Reporter, as JSON
+or in the Prometheus text format, and profile() or profile_on_signal()
+capture a cProfile dump for a closer look."""
+
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+from importlib import import_module
+from threading import Thread, Event
+from time import perf_counter
+import cProfile
+import json
+import os
+import signal
+
+# (module, class, method) for each method that enable() measures by
+# default.  Presenter inherits its methods from HeadlessPresenter, so
+# wrapping them there covers both.  Scores are placed (by Game and by
+# Scorecard.score) through Scorecard._score, and strategies look them
+# up with Scorecard.preview, so those are what's measured.
+TARGETS = [
+    ('game', 'Dice', 'roll'),
+    ('game', 'Scorecard', '_score'),
+    ('game', 'Scorecard', 'preview'),
+    ('game', 'Game', 'next_player'),
+    ('presenter', 'HeadlessPresenter', 'roll_dice'),
+    ('presenter', 'HeadlessPresenter', 'place_player_score'),
+    ('connect', 'Connection', 'send'),
+    ('connect', 'Connection', 'receive')
+]
+
+# Upper bounds of the histogram buckets, in seconds: 1us doubling up to
+# about 8s, and then everything else.
+BUCKETS = [1e-6 * 2 ** k for k in range(24)] + [float('inf')]
+
+class Histogram:
+
+    __slots__ = ('counts', 'sum')
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.counts = [0] * len(BUCKETS)
+        self.sum = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.sum += seconds
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'buckets': {repr(b): n for b, n in zip(BUCKETS, self.counts) if n}
+        }
+
+# Histograms by metric name ('Dice.roll' and so on), and the methods
+# that enable() replaced, so that disable() can put them back.
+metrics = {}
+_patched = {}
+
+def _timed(func, histogram):
+    @wraps(func)
+    def timed(*args, **kwargs):
+        start = perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            histogram.observe(perf_counter() - start)
+    return timed
+
+def enable(targets=TARGETS):
+    """Starts measuring the methods in `targets`."""
+    for module, cls_name, method in targets:
+        cls = getattr(import_module(module), cls_name)
+        if (cls, method) in _patched:
+            continue
+        name = '{}.{}'.format(cls_name, method)
+        histogram = metrics.setdefault(name, Histogram())
+        _patched[cls, method] = cls.__dict__.get(method)
+        setattr(cls, method, _timed(getattr(cls, method), histogram))
+
+def disable():
+    """Stops measuring, restoring the original methods.  The figures
+    gathered so far are kept until reset() is called."""
+    for (cls, method), original in _patched.items():
+        if original is None:
+            # The method was inherited.
+            delattr(cls, method)
+        else:
+            setattr(cls, method, original)
+    _patched.clear()
+
+def reset():
+    for h in metrics.values():
+        h.clear()
+
+def snapshot():
+    """Returns the figures as a dict mapping each metric name to its
+    count, total time and non-empty buckets."""
+    return {name: h.to_dict() for name, h in metrics.items()}
+
+def to_json():
+    return json.dumps(snapshot(), indent=2)
+
+def to_prometheus(prefix='yahtzee'):
+    """Returns the figures in the Prometheus text exposition format, as
+    one histogram metric with a label for each method."""
+    metric = '{}_call_seconds'.format(prefix)
+    lines = ['# HELP {} Time spent in instrumented methods.'.format(metric),
+             '# TYPE {} histogram'.format(metric)]
+    for name, h in metrics.items():
+        cumulative = 0
+        for bound, n in zip(BUCKETS, h.counts):
+            cumulative += n
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            lines.append('{}_bucket{{method="{}",le="{}"}} {}'.format(
+                         metric, name, le, cumulative))
+        lines.append('{}_sum{{method="{}"}} {}'.format(metric, name, h.sum))
+        lines.append('{}_count{{method="{}"}} {}'.format(
+                     metric, name, cumulative))
+    return '\n'.join(lines) + '\n'
+
+class Reporter(Thread):
+
+    """Writes the figures to `path` every `interval` seconds, in the
+    format given by `fmt` ('json' or 'prometheus'), until stopped.  The
+    file is replaced in one go, so readers never see half of it."""
+
+    def __init__(self, path, interval=10.0, fmt='json'):
+        Thread.__init__(self, daemon=True)
+        self.path = path
+        self.interval = interval
+        self.render = to_json if fmt == 'json' else to_prometheus
+        self.stopped = Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.write()
+
+    def write(self):
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            f.write(self.render())
+        os.replace(tmp, self.path)
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        self.write()
+
+@contextmanager
+def profile(path):
+    """Profiles the code in the with block, dumping the pstats data to
+    `path` at the end."""
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
+
+def profile_on_signal(path, signum=getattr(signal, 'SIGUSR1', None)):
+    """Makes signal `signum` start the profiler, and the next one stop
+    it and dump the pstats data to `path`, so a running game or server
+    can be profiled from outside (with `kill -USR1 <pid>`).  Only the
+    main thread is profiled."""
+    profiler = cProfile.Profile()
+    running = [False]
+    def toggle(signum, frame):
+        if running[0]:
+            profiler.disable()
+            profiler.dump_stats(path)
+        else:
+            profiler.enable()
+        running[0] = not running[0]
+    signal.signal(signum, toggle)
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""A load generator for server.py: thousands of simulated players,
+all in one process, playing full games against a server on localhost.
+
+Each simulated player is a coroutine with its own connection, speaking
+the same line protocol as connect.py.  Players sit at tables of
+`players` each, and each table plays `rounds` games one after another.
+Players wait `think` seconds (on average) before each command, and use
+the greedy strategy from tournament.py to decide what to do.
+
+The time from sending each command to seeing its result (JOINED for
+JOIN, TURN for START, DICE for ROLL, HELD for HOLD and SCORED for
+SCORE) is recorded, and a report of latency percentiles per command,
+throughput and errors is printed at the end.
+
+    python loadgen.py --tables 500 --players 2 --local
+
+runs 1000 players against a server started just for the test."""
+
+from argparse import ArgumentParser
+from collections import Counter, defaultdict
+from subprocess import Popen
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+from connect import MAX_LINE
+from game import Dice, Scorecard
+from tournament import greedy
+
+# The line each command's latency is measured up to
+REPLIES = {
+    'JOIN': 'JOINED',
+    'START': 'TURN',
+    'ROLL': 'DICE',
+    'HOLD': 'HELD',
+    'SCORE': 'SCORED'
+}
+
+class Stats:
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = Counter()
+        self.games = 0
+        self.start = self.end = None
+
+    def percentiles(self, cmd, qs=(50, 90, 99)):
+        times = sorted(self.latencies[cmd])
+        return [times[min(len(times) - 1, len(times) * q // 100)]
+                for q in qs]
+
+    def report(self):
+        """Returns the results as a dict, with times in milliseconds."""
+        elapsed = self.end - self.start
+        commands = sum(len(t) for t in self.latencies.values())
+        report = {
+            'elapsed': elapsed,
+            'games': self.games,
+            'games_per_second': self.games / elapsed,
+            'commands': commands,
+            'commands_per_second': commands / elapsed,
+            'errors': dict(self.errors),
+            'latency_ms': {}
+        }
+        for cmd, times in self.latencies.items():
+            p50, p90, p99 = self.percentiles(cmd)
+            report['latency_ms'][cmd] = {
+                'count': len(times),
+                'p50': p50 * 1000,
+                'p90': p90 * 1000,
+                'p99': p99 * 1000,
+                'max': max(times) * 1000
+            }
+        return report
+
+class LoadError(Exception): pass
+
+class Player:
+
+    """One simulated player, who plays `rounds` games at the table
+    `table` and leaves.  The first player at a table (the leader) joins
+    first, so that the others join once the session exists, and starts
+    each game once everyone has joined or the last game is over."""
+
+    def __init__(self, stats, table, name, leader, n_players, think):
+        self.stats = stats
+        self.table = table
+        self.name = name
+        self.leader = leader
+        self.n_players = n_players
+        self.think = think
+        self.scorecard = None
+
+    async def wait(self):
+        if self.think:
+            await asyncio.sleep(random.uniform(0, 2 * self.think))
+
+    async def receive(self):
+        line = (await self.reader.readuntil(b'\r\n'))[:-2].decode()
+        if line.startswith(('ERROR', 'LEFT')):
+            raise LoadError(line)
+        return line
+
+    async def command(self, line):
+        """Sends a command and returns its reply, recording how long it
+        took to come."""
+        cmd = line.split()[0]
+        sent = time.perf_counter()
+        self.writer.write(line.encode() + b'\r\n')
+        await self.writer.drain()
+        reply = await self.receive()
+        while not reply.startswith(REPLIES[cmd]):
+            reply = await self.receive()
+        self.stats.latencies[cmd].append(time.perf_counter() - sent)
+        return reply
+
+    async def play(self, host, port, rounds, joined):
+        try:
+            self.reader, self.writer = await asyncio.open_connection(
+                host, port, limit=MAX_LINE)
+        except OSError as e:
+            self.stats.errors['connect: {}'.format(type(e).__name__)] += 1
+            return
+        try:
+            await self.join(joined)
+            for _ in range(rounds):
+                await self.play_game()
+        except (LoadError, asyncio.IncompleteReadError,
+                asyncio.LimitOverrunError, ConnectionError) as e:
+            self.stats.errors[str(e) or type(e).__name__] += 1
+        finally:
+            self.writer.close()
+
+    async def join(self, joined):
+        if not self.leader:
+            await joined.wait()
+        await self.command('JOIN {} {}'.format(self.table, self.name))
+        if self.leader:
+            joined.set()
+            for _ in range(self.n_players - 1):
+                while not (await self.receive()).startswith('JOINED'):
+                    pass
+
+    async def play_game(self):
+        self.scorecard = Scorecard()
+        if self.leader:
+            await self.wait()
+            line = await self.command('START')
+        else:
+            line = await self.receive()
+        while not line.startswith('OVER'):
+            if line == 'TURN {}'.format(self.name):
+                line = await self.take_turn()
+            else:
+                line = await self.receive()
+        if self.leader:
+            self.stats.games += 1
+
+    async def take_turn(self):
+        """Plays a turn, and returns the first line after it."""
+        while True:
+            await self.wait()
+            *values, rolled = map(int, (await self.command('ROLL')).split()[1:])
+            dice = Dice(values)
+            dice.rolled = rolled
+            move = greedy(self.scorecard, dice)
+            if isinstance(move, str):
+                break
+            await self.wait()
+            await self.command('HOLD {}'.format(' '.join(map(str, move))))
+        await self.wait()
+        reply = await self.command('SCORE {}'.format(move))
+        self.scorecard.handle_score(int(reply.split()[3]), move)
+        return await self.receive()
+
+async def run(host, port, tables, players=2, rounds=1, think=0.0, ramp=0.0):
+    """Plays `rounds` games at each of `tables` tables of `players`
+    players, against the server at (`host`, `port`), and returns the
+    Stats.  The tables start over `ramp` seconds, rather than all at
+    once."""
+    stats = Stats()
+    tasks = []
+    stats.start = time.perf_counter()
+    for t in range(tables):
+        joined = asyncio.Event()
+        table = 'load{}'.format(t)
+        for p in range(players):
+            player = Player(stats, table, 'p{}'.format(p), p == 0, players,
+                            think)
+            tasks.append(asyncio.create_task(
+                player.play(host, port, rounds, joined)))
+        if ramp:
+            await asyncio.sleep(ramp / tables)
+    await asyncio.gather(*tasks)
+    stats.end = time.perf_counter()
+    return stats
+
+def _wait_for_server(host, port, timeout=10):
+    async def attempt():
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                _, writer = await asyncio.open_connection(host, port)
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise
+                await asyncio.sleep(0.1)
+            else:
+                writer.close()
+                return
+    asyncio.run(attempt())
+
+if __name__ == '__main__':
+
+    parser = ArgumentParser(description='Generate load on a game server.')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=5555)
+    parser.add_argument('--tables', type=int, default=100)
+    parser.add_argument('--players', type=int, default=2,
+                        help='players per table')
+    parser.add_argument('--rounds', type=int, default=1,
+                        help='games played at each table')
+    parser.add_argument('--think', type=float, default=0.0,
+                        help='mean seconds a player waits before each command')
+    parser.add_argument('--ramp', type=float, default=0.0,
+                        help='seconds over which to start the tables')
+    parser.add_argument('--local', action='store_true',
+                        help='start a server on this machine for the test')
+    args = parser.parse_args()
+
+    server = None
+    if args.local:
+        server = Popen([sys.executable,
+                        os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                     'server.py'),
+                        str(args.port)])
+        _wait_for_server(args.host, args.port)
+    try:
+        stats = asyncio.run(run(args.host, args.port, args.tables,
+                                args.players, args.rounds, args.think,
+                                args.ramp))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+    json.dump(stats.report(), sys.stdout, indent=2)
+    print()
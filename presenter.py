@@ -3,85 +3,254 @@
 
 # TODO:
 # - dict mapping player names to Players
-# - dict mapping DieLabels to dice
 
-from ui import GameInterface
-from game import Game, GameOver
+import time
+
+from game import Game, GameOver, CATEGORIES
+
+BOT_POLL = 50           # ms between checks on a computer player's move
+BOT_MOVE_TIME = 5.0     # seconds a computer player has for each move
+
+class HeadlessPresenter:
+
+    """Runs a game according to the rules, without any user interface,
+    so it can be used by a server or a script as well as by Presenter.
+
+    Each method that changes the game calls one of dice_rolled,
+    die_toggled, score_placed, next_turn and game_over afterwards,
+    which do nothing here; a front end overrides them to show the
+    change."""
 
-class Presenter:
-    
     def __init__(self, players):
-        self.ui = None
         self.player_names = players
         self.new_game()
-    
+
     def new_game(self):
-        
         self.game = Game(self.player_names)
         self.players = {p.name: p for p in self.game.players}
-        # prepare Dice for iteration (for when we assign DieLabels)
-        self.dice = iter(self.game.dice)
-        self.dice_by_label = {}
+
+    def roll_dice(self):
+        """Rolls the dice.  Returns False if the current player has
+        already rolled three times."""
+        if self.game.dice.rolled >= 3:
+            return False
+        self.game.roll()
+        self.dice_rolled()
+        return True
+
+    def toggle_die_hold(self, i):
+        """Holds or releases the die at index `i`.  Returns False if
+        the current player hasn't rolled yet, or has no rolls left."""
+        if not 1 <= self.game.dice.rolled < 3:
+            # Player has to roll all 5 dice on first roll, and there's
+            # nothing to hold them for after the last
+            return False
+        self.game.toggle_hold(i)
+        self.die_toggled(i)
+        return True
+
+    def place_player_score(self, p_name, cat):
+        """Scores the dice in `cat` for the named player, if it is their
+        turn, then moves on to the next turn.  Returns the score, or None
+        if the score can't be placed."""
+        player = self.game.current_player
+        if player.name != p_name:
+            # Player is clicking on someone else's tiles,
+            # so do nothing.
+            return None
+        if self.game.dice.rolled < 1:
+            # Player hasn't rolled yet so don't allow to place score.
+            return None
+        if player.scorecard.is_filled(cat):
+            return None
+        try:
+            score = self.game.place_score(cat)
+        except GameOver:
+            score = player.scorecard.scores[cat]
+            self.score_placed(p_name, cat, score)
+            self.game_over()
+        else:
+            self.score_placed(p_name, cat, score)
+            self.next_turn()
+        return score
+
+    def score_options(self):
+        """Returns a dict mapping each category the current player has
+        yet to fill to what the dice would score there, or an empty dict
+        if they haven't rolled yet."""
+        if self.game.dice.rolled < 1:
+            return {}
+        scores, filled = self.game.current_player.scorecard.preview(
+                            self.game.dice)
+        return {c: scores[i] for i, c in enumerate(CATEGORIES)
+                if not filled[i]}
+
+    def dice_rolled(self):
+        pass
+
+    def die_toggled(self, i):
+        pass
+
+    def score_placed(self, p_name, cat, score):
+        pass
+
+    def next_turn(self):
+        pass
+
+    def game_over(self):
+        pass
+
+class Presenter(HeadlessPresenter):
+
+    """Runs a game with a Tk GameInterface.
+
+    `bots` maps the names of any computer-controlled players to their
+    strategies (as in tournament.py).  Their moves are worked out by
+    `executor` (by default, a single background thread) while the
+    interface carries on, and checked for every BOT_POLL ms with
+    after().  A move that takes longer than `move_time` seconds is
+    abandoned, and the greedy strategy's move made instead.  A thread
+    can't be stopped, so the default executor is replaced by a new one
+    when that happens, rather than leaving later moves queued behind
+    the abandoned one; an `executor` passed in should have enough
+    workers not to be held up that way."""
+
+    def __init__(self, players, bots=None, executor=None,
+                 move_time=BOT_MOVE_TIME):
+        self.ui = None
+        self.bots = bots or {}
+        self.own_executor = executor is None
+        self.executor = executor or self.new_executor()
+        self.move_time = move_time
+        # (game, future, deadline) for the move being worked out
+        self.move = None
+        HeadlessPresenter.__init__(self, players)
+
+    def new_executor(self):
+        # Imported here so that a game without computer players doesn't
+        # pay for loading concurrent.futures.
+        from concurrent.futures import ThreadPoolExecutor
+        return ThreadPoolExecutor(1)
+
+    def new_game(self):
+        HeadlessPresenter.new_game(self)
         self.setup_ui()
-    
+
     def setup_ui(self):
         if self.ui is not None:
-            self.ui.destroy()
+            # The players are the same, so the interface can be reused.
+            self.ui.reset()
+            self.start_turn()
+            return
+        # Imported here so that tkinter is only loaded (and a display
+        # only needed) once there is actually an interface to show.
+        from ui import GameInterface
+        # maps each DieLabel to the index of its die
+        self.dice_by_label = {}
         self.ui = GameInterface(self)
+        self.start_turn()
         self.ui.run()
-        
+
+    @property
+    def is_bot_turn(self):
+        return self.game.current_player.name in self.bots
+
     def roll_dice(self):
-        self.game.dice.roll()
+        # The interface can't act for a computer player.
+        if not self.is_bot_turn:
+            return HeadlessPresenter.roll_dice(self)
+
+    def place_player_score(self, p_name, cat):
+        if not self.is_bot_turn:
+            return HeadlessPresenter.place_player_score(self, p_name, cat)
+
+    def start_turn(self):
+        # Computer players' turns are played from here, a move at a
+        # time, by think() and poll_move().
+        if self.is_bot_turn:
+            self.ui.disable_roll()
+            HeadlessPresenter.roll_dice(self)
+            self.think()
+
+    def think(self):
+        player = self.game.current_player
+        future = self.executor.submit(self.bots[player.name],
+                                      player.scorecard, self.game.dice)
+        self.move = (self.game, future, time.monotonic() + self.move_time)
+        self.ui.after(BOT_POLL, self.poll_move, self.move)
+
+    def poll_move(self, pending):
+        # `pending` is the move this check was scheduled for, which may
+        # no longer be self.move if a new game has been started since.
+        game, future, deadline = pending
+        if pending is not self.move or game is not self.game:
+            future.cancel()
+            return
+        if future.done():
+            move = future.result()
+        elif time.monotonic() >= deadline:
+            self.abandon(future)
+            from tournament import greedy
+            move = greedy(self.game.current_player.scorecard, self.game.dice)
+        else:
+            self.ui.after(BOT_POLL, self.poll_move, pending)
+            return
+        self.move = None
+        self.make_move(move)
+
+    def abandon(self, future):
+        if not future.cancel() and self.own_executor:
+            # It's still running, and would hold up every later move.
+            self.executor.shutdown(wait=False)
+            self.executor = self.new_executor()
+
+    def make_move(self, move):
+        player = self.game.current_player
+        if (isinstance(move, (list, tuple)) and self.game.dice.rolled < 3
+                and all(i in range(5) for i in move)):
+            self.game.hold(move)
+            HeadlessPresenter.roll_dice(self)
+            self.think()
+            return
+        options = self.score_options()
+        if not isinstance(move, str) or move not in options:
+            # It has no rolls left, or has asked to hold dice that
+            # aren't there or picked a category it can't score in, so
+            # take the best score it can.
+            move = max(options, key=options.get)
+        HeadlessPresenter.place_player_score(self, player.name, move)
+
+    def dice_rolled(self):
         for d in self.ui.die_labels:
-            self.update_die_label(d)
+            self.ui.schedule(d, self.update_die_label, d)
         if self.game.dice.rolled >= 3:
             self.ui.disable_roll()
-    
+
     def update_die_label(self, die_label, init=False):
         # init is True if this is being called on the initialisation
-        # of the DieLabel instance, in which case we set the associated
-        # Die, rather than fetching it
+        # of the DieLabel instance, in which case we assign it the next
+        # die, rather than looking it up
         if init:
-            die = next(self.dice)
-            self.dice_by_label[die_label] = die
-        else:
-            die = self.dice_by_label[die_label]
+            self.dice_by_label[die_label] = len(self.dice_by_label)
+        die = self.game.dice.dice[self.dice_by_label[die_label]]
         die_label.update_img(die.value, die.is_held)
-    
+
     def toggle_die_hold(self, die_label):
-        die = self.dice_by_label[die_label]
-        if die.dice.rolled < 1:
-            # Player has to roll all 5 dice on first roll
+        if self.is_bot_turn:
             return
-        die.is_held = not die.is_held
-        self.update_die_label(die_label)
-        
+        if HeadlessPresenter.toggle_die_hold(self, self.dice_by_label[die_label]):
+            self.ui.schedule(die_label, self.update_die_label, die_label)
+
+    def score_placed(self, p_name, cat, score):
+        self.ui.add_player_score(p_name, cat, score)
+
     def next_turn(self):
-        # Called when a player places his or her score.  Calls
-        # game.next_player() and then updates the UI accordingly.
-        print('next turn')
-        try:
-            self.game.next_player()
-        except GameOver:
-            print('game over')
-            self.game_over()
-        for p_name in self.players:
-            self.ui.update_player_col(p_name)
+        # Called when a player has placed his or her score.  Updates
+        # the UI for the next player's turn.
+        self.ui.set_current_player(self.game.current_player.name)
         self.ui.enable_roll()
-    
-    def place_player_score(self, p_name, cat):
+        self.start_turn()
 
-        if self.game.current_player.name != p_name:
-            # Player is clicking on someone else's tiles,
-            # so do nothing.
-            return
-        if self.game.dice.rolled < 1:
-            # Player hasn't rolled yet so don't allow to place score.
-            return
-        score = self.game.current_player.scorecard.score(cat, self.game.dice)
-        self.ui.add_player_score(p_name, cat, score)
-        self.next_turn()
-    
     def game_over(self):
         winners, highest_score = self.game.winners
         if len(winners) == 1:
@@ -92,10 +261,12 @@ class Presenter:
             self.new_game()
         else:
             self.quit()
-    
+
     def quit(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
         self.ui.quit()
 
 if __name__ == '__main__':
-    
-    p = Presenter(['alan', 'mark', 'john'])
+
+    from tournament import greedy
+    p = Presenter(['alan', 'mark', 'john'], bots={'john': greedy})
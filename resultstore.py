@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""A columnar store for the outcome of every game in a large simulation.
+
+There is one row per player per game, and each column is kept in a file
+of its own in the store's directory, as a plain array of fixed-size
+numbers:
+
+    game        the game's number within the run (u4)
+    seed        the run's seed (i8); with `game`, it determines the dice
+    seat        the player's place in the turn order (u1)
+    strategy    index into the store's list of strategy names (u1)
+    ones ... c  the final score in each category, named as in CATEGORIES
+                (i2)
+    bonus       the upper section bonus (u1)
+    total       the final total (i2)
+    winner      1 if the player won or shared the win, else 0 (u1)
+
+Rows are written in chunks of `chunk_rows`, so only one chunk is held
+in memory at a time, and each chunk of each column can be compressed
+with zlib.  meta.json records the columns' types and where each chunk
+is, and is rewritten after every chunk.
+
+ResultsReader loads only the columns a query asks for.  Uncompressed
+columns are memory-mapped, so only the pages actually used are read;
+compressed ones are read and decompressed a chunk at a time.
+
+    python resultstore.py DIR GAMES [--compress]
+
+simulates GAMES games between the greedy and random strategies, and
+stores the results in DIR."""
+
+from argparse import ArgumentParser
+from multiprocessing import Pool
+from os.path import join, getsize
+import json
+import os
+import zlib
+
+import numpy as np
+
+from game import CATEGORIES
+from tournament import greedy, random_strategy, play_games, strategy_name
+
+COLUMNS = [
+    ('game', '<u4'),
+    ('seed', '<i8'),
+    ('seat', 'u1'),
+    ('strategy', 'u1'),
+] + [(c, '<i2') for c in CATEGORIES] + [
+    ('bonus', 'u1'),
+    ('total', '<i2'),
+    ('winner', 'u1')
+]
+ROW_DTYPE = np.dtype(COLUMNS)
+
+META = 'meta.json'
+
+def game_rows(games, seed, strategy_ids):
+    """Returns the rows for `games`, a list of (number, Game) pairs from
+    a run seeded with `seed`, as a structured array.  The player in
+    seat i was played by strategy number strategy_ids[i]."""
+    rows = []
+    for n, game in games:
+        winners, _ = game.winners
+        for seat, p in enumerate(game.players):
+            card = p.scorecard
+            rows.append((n, seed, seat, strategy_ids[seat],
+                         *(card.scores[c] for c in CATEGORIES),
+                         card.bonus, card.total, p in winners))
+    return np.array(rows, ROW_DTYPE)
+
+class ResultsWriter:
+
+    """Writes rows to a new store in the directory `path` (which is
+    created if need be; any store already there is replaced).
+    `strategies` is the list of names that the strategy column indexes
+    into."""
+
+    def __init__(self, path, strategies, chunk_rows=1 << 16, compress=False,
+                 level=6):
+        self.path = path
+        self.chunk_rows = chunk_rows
+        self.level = level if compress else None
+        os.makedirs(path, exist_ok=True)
+        self.meta = {
+            'strategies': list(strategies),
+            'columns': dict(COLUMNS),
+            'compression': 'zlib' if compress else None,
+            'rows': 0,
+            # For each chunk, its row count and, for each column, the
+            # offset and length of its bytes in the column's file.
+            'chunks': []
+        }
+        self.files = {name: open(join(path, name + '.col'), 'wb')
+                      for name, _ in COLUMNS}
+        self.pending = []
+        self.pending_rows = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, rows):
+        """Adds `rows`, a structured array of ROW_DTYPE."""
+        self.pending.append(rows)
+        self.pending_rows += len(rows)
+        while self.pending_rows >= self.chunk_rows:
+            rows = np.concatenate(self.pending)
+            self._write_chunk(rows[:self.chunk_rows])
+            rest = rows[self.chunk_rows:]
+            self.pending = [rest]
+            self.pending_rows = len(rest)
+
+    def _write_chunk(self, rows):
+        chunk = {'rows': len(rows), 'columns': {}}
+        for name, f in self.files.items():
+            data = np.ascontiguousarray(rows[name]).tobytes()
+            if self.level is not None:
+                data = zlib.compress(data, self.level)
+            chunk['columns'][name] = (f.tell(), len(data))
+            f.write(data)
+            f.flush()
+        self.meta['chunks'].append(chunk)
+        self.meta['rows'] += len(rows)
+        self._write_meta()
+
+    def _write_meta(self):
+        # Replaced in one go, so a reader never sees it half-written,
+        # and it never mentions chunks that aren't on disk yet.
+        tmp = join(self.path, META + '.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(self.meta, f)
+        os.replace(tmp, join(self.path, META))
+
+    def close(self):
+        if self.pending_rows:
+            self._write_chunk(np.concatenate(self.pending))
+        elif not self.meta['chunks']:
+            self._write_meta()
+        self.pending = []
+        self.pending_rows = 0
+        for f in self.files.values():
+            f.close()
+
+class ResultsReader:
+
+    """Reads a store written by ResultsWriter.  Columns are loaded (or
+    mapped) the first time they are asked for, and kept."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(join(path, META)) as f:
+            self.meta = json.load(f)
+        self.strategies = self.meta['strategies']
+        self._columns = {}
+
+    def __len__(self):
+        return self.meta['rows']
+
+    def __getitem__(self, name):
+        return self.column(name)
+
+    def column(self, name):
+        """Returns the column `name` as a numpy array."""
+        if name not in self._columns:
+            self._columns[name] = self._load(name)
+        return self._columns[name]
+
+    def _load(self, name):
+        dtype = np.dtype(self.meta['columns'][name])
+        path = join(self.path, name + '.col')
+        rows = self.meta['rows']
+        if self.meta['compression'] is None:
+            if rows == 0 or getsize(path) == 0:
+                # An empty file can't be mapped.
+                return np.zeros(0, dtype)
+            return np.memmap(path, dtype, 'r', shape=(rows,))
+        column = np.empty(rows, dtype)
+        start = 0
+        with open(path, 'rb') as f:
+            for chunk in self.meta['chunks']:
+                offset, length = chunk['columns'][name]
+                f.seek(offset)
+                data = zlib.decompress(f.read(length))
+                column[start:start+chunk['rows']] = np.frombuffer(data, dtype)
+                start += chunk['rows']
+        return column
+
+    def by_strategy(self, values):
+        """Returns a dict mapping each strategy's name to the mean of
+        `values` (an array with one item per row) over its rows."""
+        strategy = self.column('strategy')
+        sums = np.bincount(strategy, values, len(self.strategies))
+        counts = np.bincount(strategy, minlength=len(self.strategies))
+        return {name: float(s / n) for name, s, n
+                in zip(self.strategies, sums, counts) if n}
+
+    def yahtzee_rate(self):
+        """The fraction of players' games with a Yahtzee scored."""
+        return float(np.mean(self.column('y') == 50))
+
+    def bonus_rate_by_strategy(self):
+        return self.by_strategy(self.column('bonus') > 0)
+
+    def win_rate_by_strategy(self):
+        return self.by_strategy(self.column('winner'))
+
+    def mean_total_by_strategy(self):
+        return self.by_strategy(self.column('total'))
+
+def _play_rows(args):
+    strategies, seed, start, count, strategy_ids = args
+    return game_rows(list(play_games(strategies, seed, start, count)),
+                     seed, strategy_ids)
+
+def simulate(path, strategies, games, seed=0, processes=None,
+             batch_size=1000, **options):
+    """Plays `games` games between `strategies` on a pool of worker
+    processes, as tournament.run does, and stores each game's results
+    in a new store at `path`.  `options` are passed to ResultsWriter."""
+    names = []
+    for s in strategies:
+        if strategy_name(s) not in names:
+            names.append(strategy_name(s))
+    ids = [names.index(strategy_name(s)) for s in strategies]
+    batches = [(strategies, seed, start, min(batch_size, games - start), ids)
+               for start in range(0, games, batch_size)]
+    with ResultsWriter(path, names, **options) as writer, \
+            Pool(processes) as pool:
+        # In order, so the rows come out in order of game number.
+        for rows in pool.imap(_play_rows, batches):
+            writer.write(rows)
+
+if __name__ == '__main__':
+
+    parser = ArgumentParser(description='Store simulated game results.')
+    parser.add_argument('path')
+    parser.add_argument('games', type=int)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--compress', action='store_true')
+    args = parser.parse_args()
+
+    simulate(args.path, [greedy, random_strategy], args.games, args.seed,
+             compress=args.compress)
+    reader = ResultsReader(args.path)
+    print('{} rows'.format(len(reader)))
+    print('Yahtzee rate: {:.4f}'.format(reader.yahtzee_rate()))
+    for name, rate in reader.bonus_rate_by_strategy().items():
+        print('{} bonus rate: {:.4f}'.format(name, rate))
+    for name, rate in reader.win_rate_by_strategy().items():
+        print('{} win rate: {:.4f}'.format(name, rate))
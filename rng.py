@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Random number streams for rolling dice.
+
+A DiceRNG is a seedable stream of die faces.  Rather than calling into
+the random module once per die, it draws random bytes in bulk, turns
+them into faces with bytes.translate (throwing away the few bytes that
+would make some faces likelier than others) and hands faces out of
+that buffer.
+
+Streams can be split: spawn(key) gives a new stream whose seed is
+derived from this stream's seed and `key`, so each game or worker
+process can have its own stream, independent of the others and
+reproducible from the one seed however the work is scheduled."""
+
+from hashlib import sha256
+import os
+import random
+
+# Bytes 0-251 map evenly onto the faces 1-6; 252-255 are rejected.
+_FACES = bytes(b % 6 + 1 for b in range(256))
+_REJECT = bytes(range(252, 256))
+
+class DiceRNG:
+
+    def __init__(self, seed=None, buffer_size=256):
+        self.buffer_size = buffer_size
+        self.reseed(seed)
+
+    def reseed(self, seed=None):
+        """Starts the stream again from `seed`, or from a random seed
+        if it is None."""
+        if seed is None:
+            seed = int.from_bytes(os.urandom(16), 'big')
+        self.seed = seed
+        self._random = random.Random(seed)
+        self._buffer = b''
+        self._pos = 0
+
+    def spawn(self, key):
+        """Returns a new stream determined by this stream's seed and
+        `key` (anything with a stable repr, such as an int or a tuple of
+        them)."""
+        digest = sha256(repr((self.seed, key)).encode()).digest()
+        return DiceRNG(int.from_bytes(digest[:16], 'big'), self.buffer_size)
+
+    def split(self, n):
+        """Returns `n` independent streams, spawned with keys 0 to n-1."""
+        return [self.spawn(i) for i in range(n)]
+
+    def _refill(self, n):
+        # Keep whatever is left over and draw until there are at least
+        # n faces available.
+        faces = [self._buffer[self._pos:]]
+        have = len(faces[0])
+        while have < n:
+            new = self._random.randbytes(max(self.buffer_size, n)).translate(
+                        _FACES, _REJECT)
+            faces.append(new)
+            have += len(new)
+        self._buffer = b''.join(faces)
+        self._pos = 0
+
+    def faces(self, n):
+        """Returns the next `n` die faces, as a bytes object (which
+        gives ints 1-6 when indexed or iterated over)."""
+        if self._pos + n > len(self._buffer):
+            self._refill(n)
+        pos = self._pos
+        self._pos = pos + n
+        return self._buffer[pos:pos+n]
+
+    def face(self):
+        return self.faces(1)[0]
+
+# Used by dice that aren't given a stream of their own.
+default_rng = DiceRNG()
+
+# A forked process would otherwise carry on with its parent's stream,
+# and roll the same dice as every other process forked from it.
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=default_rng.reseed)
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Variants of the rules, for leagues that don't play the standard
+game.  A Rules object can change:
+
+    points          the scores for a full house, short and long
+                    straights and a Yahtzee ('fh', 'ss', 'ls', 'y')
+    bonus           the upper section bonus, and bonus_threshold, the
+                    upper total needed for it
+    yahtzee_bonus   points for each Yahtzee after the first, if the
+                    first was scored in the Yahtzee box (0 for none)
+    joker           once the Yahtzee box is filled, a Yahtzee scores
+                    full points as a full house or straight
+    forced_upper    once the Yahtzee box is filled, a Yahtzee must be
+                    scored in its upper category if that's open, or
+                    else (with joker) in the lower section if anything
+                    there is open
+
+Each Rules is compiled when it is made: its score table (the scores of
+all 252 rolls in each category, as game.SCORE_TABLE), the joker scores
+of the six Yahtzees and, with forced_upper, a mask of the categories
+allowed for each Yahtzee and each set of filled categories.  Scoring
+under any variant is then a table lookup, as for the standard rules.
+get_rules() hands out one shared Rules object per set of options, so
+every game with the same variant uses the same tables.
+
+The standard rules don't need any of this, and plain Scorecards are
+left as they were; a game only pays for a variant if it uses one:
+
+    game = Game(['ann', 'bob'], rules=get_rules(yahtzee_bonus=100))
+    game = Game(['ann', 'bob'], rules=get_variant('official'))
+"""
+
+from array import array
+from functools import lru_cache
+
+from game import (Scorecard, IllegalMoveError, CAT_INDEX, UPPER_SECTION,
+                  FULL_CARD, ROLL_INDEX, SCORE_TABLE, filled_flags)
+
+_N_UPPER = len(UPPER_SECTION)
+_Y_BIT = 1 << CAT_INDEX['y']
+_LOWER_MASK = FULL_CARD & ~((1 << _N_UPPER) - 1)
+
+STANDARD_POINTS = {'fh': 25, 'ss': 30, 'ls': 40, 'y': 50}
+
+# The index in ROLLS of the Yahtzee of each face
+_YAHTZEES = {ROLL_INDEX[(face,) * 5]: face for face in range(1, 7)}
+
+class Rules:
+
+    def __init__(self, points=None, bonus=35, bonus_threshold=63,
+                 yahtzee_bonus=0, joker=False, forced_upper=False):
+        points = points or {}
+        for cat in points:
+            if cat not in STANDARD_POINTS:
+                raise ValueError('Points can only be set for {}, not {!r}.'
+                                 .format(', '.join(STANDARD_POINTS), cat))
+        self.points = dict(STANDARD_POINTS, **points)
+        self.bonus = bonus
+        self.bonus_threshold = bonus_threshold
+        self.yahtzee_bonus = yahtzee_bonus
+        self.joker = joker
+        self.forced_upper = forced_upper
+        self.table = self._score_table()
+        self.joker_rows = self._joker_rows() if joker else {}
+        self.allowed_masks = self._allowed_masks() if forced_upper else None
+
+    def _score_table(self):
+        if self.points == STANDARD_POINTS:
+            return SCORE_TABLE
+        # The fixed-value categories score either nothing or their
+        # points, so swap in the new points wherever they score.
+        fixed = [(CAT_INDEX[c], p) for c, p in self.points.items()]
+        table = []
+        for row in SCORE_TABLE:
+            row = list(row)
+            for i, p in fixed:
+                if row[i]:
+                    row[i] = p
+            table.append(tuple(row))
+        return table
+
+    def _joker_rows(self):
+        rows = {}
+        for index in _YAHTZEES:
+            row = list(self.table[index])
+            for c in ('fh', 'ss', 'ls'):
+                row[CAT_INDEX[c]] = self.points[c]
+            rows[index] = tuple(row)
+        return rows
+
+    def _allowed_masks(self):
+        # masks[face-1][filled] is the categories a Yahtzee of `face`
+        # may be scored in, given the categories already filled.
+        masks = []
+        for face in range(1, 7):
+            upper = 1 << face - 1
+            allowed = array('H', bytes(2 * (FULL_CARD + 1)))
+            for filled in range(FULL_CARD + 1):
+                open_cats = ~filled & FULL_CARD
+                if filled & _Y_BIT:
+                    if open_cats & upper:
+                        open_cats = upper
+                    elif self.joker and open_cats & _LOWER_MASK:
+                        open_cats &= _LOWER_MASK
+                allowed[filled] = open_cats
+            masks.append(allowed)
+        return masks
+
+    def scores(self, index, filled):
+        """Returns the scores of the roll with index `index` in ROLLS in
+        each category, for a scorecard whose filled categories are
+        `filled`."""
+        if filled & _Y_BIT and index in self.joker_rows:
+            return self.joker_rows[index]
+        return self.table[index]
+
+    def allowed(self, index, filled):
+        """Returns a bitmask of the categories the roll with index
+        `index` may be scored in, for a scorecard whose filled
+        categories are `filled`."""
+        if self.allowed_masks is not None and index in _YAHTZEES:
+            return self.allowed_masks[_YAHTZEES[index] - 1][filled]
+        return ~filled & FULL_CARD
+
+    def new_scorecard(self):
+        return RulesScorecard(self)
+
+@lru_cache(maxsize=None)
+def _get_rules(points, *options):
+    return Rules(dict(points), *options)
+
+def get_rules(points=None, bonus=35, bonus_threshold=63, yahtzee_bonus=0,
+              joker=False, forced_upper=False):
+    """Returns the Rules for the given options, which are compiled the
+    first time they are asked for and shared after that."""
+    points = tuple(sorted(dict(STANDARD_POINTS, **(points or {})).items()))
+    return _get_rules(points, bonus, bonus_threshold, yahtzee_bonus,
+                      bool(joker), bool(forced_upper))
+
+STANDARD = get_rules()
+
+# The options of the named variants, such as a league might play.  Each
+# is only compiled once asked for, with get_variant().
+VARIANTS = {
+    'standard': {},
+    'official': {'yahtzee_bonus': 100, 'joker': True, 'forced_upper': True},
+    'free_joker': {'yahtzee_bonus': 100, 'joker': True}
+}
+
+def get_variant(name):
+    """Returns the Rules of the variant called `name` in VARIANTS."""
+    return get_rules(**VARIANTS[name])
+
+class RulesScorecard(Scorecard):
+
+    """A Scorecard that scores according to `rules`."""
+
+    def __init__(self, rules):
+        Scorecard.__init__(self)
+        self.rules = rules
+        self.yahtzee_bonus = 0
+
+    def _score(self, cat, dice, preview=False):
+        index = dice.index
+        i = CAT_INDEX[cat]
+        score = self.rules.scores(index, self.filled)[i]
+        if preview:
+            return score
+        if not self.filled >> i & 1 and \
+                not self.rules.allowed(index, self.filled) >> i & 1:
+            raise IllegalMoveError(
+                'This Yahtzee must be scored in another category.')
+        bonus_due = (index in _YAHTZEES and self.rules.yahtzee_bonus and
+                     self.scores['y'] == self.rules.points['y'])
+        self.handle_score(score, cat)
+        if bonus_due:
+            self.yahtzee_bonus += self.rules.yahtzee_bonus
+        return score
+
+    def score_all(self, dice):
+        return self.rules.scores(dice.index, self.filled)
+
+    def preview(self, dice):
+        """As Scorecard.preview, except that a category the dice can't
+        be scored in under the rules is flagged as if it were filled."""
+        index = dice.index
+        return (self.rules.scores(index, self.filled),
+                filled_flags(~self.rules.allowed(index, self.filled)
+                             & FULL_CARD))
+
+    @property
+    def bonus(self):
+        if self.upper_score >= self.rules.bonus_threshold:
+            return self.rules.bonus
+        return 0
+
+    @property
+    def total(self):
+        return (self.upper_score + self._lower + self.bonus
+                + self.yahtzee_bonus)
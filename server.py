@@ -0,0 +1,464 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""An asyncio server that hosts any number of concurrent games over
+TCP, using the same CRLF-terminated line protocol as connect.py.
+
+Clients send commands, one per line:
+
+    JOIN <game> <name>  join the named game, creating it if necessary (or
+                        rejoin a game restored from a checkpoint)
+    START               start the game with the players who have joined
+    ROLL                roll the dice (other than any held)
+    HOLD [<i> ...]      hold the dice at the given indices (0-4), and
+                        release the rest
+    SCORE <category>    score the dice in the given category
+    WATCH <game>        watch the named game as a spectator
+    BINARY              switch to binary updates (see below)
+    QUIT                leave
+
+Every player in a game is sent these as the game progresses:
+
+    JOINED <name>
+    TURN <name>
+    DICE <v1> <v2> <v3> <v4> <v5> <rolled>
+    HELD [<i> ...]
+    SCORED <name> <category> <score> <total>
+    OVER <score> <name> [<name> ...]
+    LEFT <name>
+
+and a client is sent `ERROR <message>` if its command fails.  Spectators
+are sent the same lines as the players, starting with enough to catch
+up with a game already going, including a line for each player's card:
+
+    CARD <name> <score or -> ... <total>
+
+A client that sends BINARY (before joining or watching a game) is sent
+`BINARY` in reply, and from then on everything it is sent is a wire.py
+frame rather than a line: a DICE frame for each roll or change of
+holds, a SCORE frame for each score placed and a TURN frame for each
+change of turn.  Anything else is sent as a TEXT frame holding the line
+a text client would be sent.  When a game starts, a binary client is
+first sent `PLAYERS <name> ...`, giving the order the frames number the
+players in, and catching up with a game already going, that and a STATE
+frame.  The client's own commands are still sent as lines.
+
+Each change to a game is turned into a line, and encoded, just once, by
+a listener on the Game, and the same bytes are then queued for everyone
+in the session.
+Each connection's outgoing lines go through a bounded queue, drained by
+its own writer task, so one slow client never holds up the others.  If
+a client falls behind, dice states it hasn't been sent yet are replaced
+by newer ones, so it skips to the latest dice; a client that lets its
+queue fill up even so is disconnected.
+
+Given a checkpoint file, the server saves the state of every game in
+progress to it every few seconds, and on starting restores the games
+saved there, for their players to rejoin."""
+
+from collections import deque
+from inspect import signature
+import asyncio
+from sys import argv
+
+from checkpoint import Checkpoint, load
+from game import Game, GameOver, IllegalMoveError, AlreadyScoredError, CATEGORIES
+from wire import (DICE, encode_dice, encode_score, encode_state, encode_text,
+                  encode_turn)
+
+MAX_LINE = 1024
+MAX_QUEUE = 256
+CHECKPOINT_INTERVAL = 2.0
+
+def encode(line):
+    """Returns `line` as it is sent: encoded, and ending in CRLF."""
+    return line.encode() + b'\r\n'
+
+class LineQueue:
+
+    """A bounded queue of encoded lines (or frames) waiting to be sent
+    to one client.  A DICE line replaces any DICE and HELD lines at the
+    end of the queue, and a HELD line any HELD line there, as they would
+    be out of date by the time they were sent.  Likewise a DICE frame,
+    which has the holds too, replaces any DICE frame there."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.lines = deque()
+        self.ready = asyncio.Event()
+
+    def __len__(self):
+        return len(self.lines)
+
+    def _superseded(self, line):
+        last = self.lines[-1]
+        if last is None:
+            return False
+        if line.startswith(b'DICE'):
+            return last.startswith((b'DICE', b'HELD'))
+        if line.startswith(b'HELD'):
+            return last.startswith(b'HELD')
+        return line[0] == DICE and last[0] == DICE
+
+    def put_nowait(self, line):
+        """Adds `line` (or None, to tell the writer to stop) to the
+        queue.  Raises asyncio.QueueFull if there's no room."""
+        if line is not None:
+            while self.lines and self._superseded(line):
+                self.lines.pop()
+        if len(self.lines) >= self.maxsize:
+            raise asyncio.QueueFull
+        self.lines.append(line)
+        self.ready.set()
+
+    async def get(self):
+        while not self.lines:
+            self.ready.clear()
+            await self.ready.wait()
+        return self.lines.popleft()
+
+class Session:
+
+    """The players in one game, and the game itself once started,
+    and anyone watching it."""
+
+    def __init__(self, name):
+        self.name = name
+        self.clients = {}
+        self.spectators = set()
+        self.game = None
+
+    def broadcast(self, line, frames=None):
+        """Sends `line` to the text clients, and `frames` (by default,
+        the line in a TEXT frame) to the binary ones.  Each is encoded
+        just once, however many clients there are."""
+        data = encode(line)
+        binary = None
+        for c in list(self.clients.values()) + list(self.spectators):
+            if c.binary:
+                if binary is None:
+                    binary = encode_text(line) if frames is None else frames
+                c.send_data(binary)
+            else:
+                c.send_data(data)
+
+    def players_frame(self):
+        return encode_text('PLAYERS {}'.format(
+                           ' '.join(p.name for p in self.game.players)))
+
+    def start(self, game=None):
+        """Starts a new game with the players who have joined, or
+        carries on with `game`."""
+        self.game = game or Game(list(self.clients))
+        self.game.listeners.append(self.game_changed)
+        if game is None:
+            self.broadcast('TURN {}'.format(self.game.current_player.name),
+                           self.players_frame()
+                           + encode_turn(self.game._player_i))
+
+    def game_changed(self, game, event, *args):
+        frames = None
+        if event == 'roll':
+            line = 'DICE {} {}'.format(' '.join(map(str, game.dice.values)),
+                                       game.dice.rolled)
+            frames = encode_dice(game.dice)
+        elif event == 'hold':
+            line = 'HELD {}'.format(' '.join(map(str, args[0])))
+            frames = encode_dice(game.dice)
+        elif event == 'score':
+            player_i, cat, score = args
+            player = game.players[player_i]
+            line = 'SCORED {} {} {} {}'.format(player.name, cat, score,
+                                               player.scorecard.total)
+            frames = encode_score(player_i, cat, score)
+        elif event == 'turn':
+            line = 'TURN {}'.format(game.players[args[0]].name)
+            frames = encode_turn(args[0])
+        elif event == 'over':
+            winners, highest = game.winners
+            line = 'OVER {} {}'.format(highest,
+                                       ' '.join(p.name for p in winners))
+        else:
+            return
+        self.broadcast(line, frames)
+
+    def catch_up(self, binary=False):
+        """Returns what a new spectator (or a player rejoining a restored
+        game) needs to see the state of the session, as encoded lines or,
+        if `binary`, frames."""
+        lines = ['JOINED {}'.format(name) for name in self.clients]
+        game = self.game
+        if binary:
+            data = [encode_text(line) for line in lines]
+            if game is not None:
+                data.append(self.players_frame() + encode_state(game))
+            return data
+        if game is not None:
+            for p in game.players:
+                card = p.scorecard
+                lines.append('CARD {} {} {}'.format(p.name, ' '.join(
+                    '-' if not card.is_filled(c) else str(card.scores[c])
+                    for c in CATEGORIES), card.total))
+            lines.append('TURN {}'.format(game.current_player.name))
+            if game.dice.rolled:
+                lines.append('DICE {} {}'.format(
+                    ' '.join(map(str, game.dice.values)), game.dice.rolled))
+                lines.append('HELD {}'.format(
+                    ' '.join(map(str, game.dice.held))))
+        return [encode(line) for line in lines]
+
+class Client:
+
+    def __init__(self, server, reader, writer):
+        self.server = server
+        self.reader = reader
+        self.writer = writer
+        self.queue = LineQueue(server.max_queue)
+        self.name = None
+        self.session = None
+        self.closed = False
+        # Whether the client has switched to binary frames
+        self.binary = False
+
+    def send(self, line):
+        """Queues `line` to be sent (in a TEXT frame, to a binary
+        client).  Never blocks; if the client is so far behind that its
+        queue is full, it is disconnected."""
+        self.send_data(encode_text(line) if self.binary else encode(line))
+
+    def send_data(self, data):
+        """As send(), for a line already encoded by encode(), or for
+        frames."""
+        if self.closed:
+            return
+        try:
+            self.queue.put_nowait(data)
+        except asyncio.QueueFull:
+            self.abort()
+
+    def abort(self):
+        """Drops the connection without sending anything still queued."""
+        self.closed = True
+        self.writer.transport.abort()
+
+    async def write_loop(self):
+        try:
+            while True:
+                data = await self.queue.get()
+                if data is None:
+                    break
+                self.writer.write(data)
+                # Only actually waits once the transport's buffer has
+                # grown past its high-water mark.
+                await self.writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.closed = True
+            self.writer.close()
+
+    async def read_loop(self):
+        while not self.closed:
+            try:
+                line = await self.reader.readuntil(b'\r\n')
+            except asyncio.LimitOverrunError:
+                self.send('ERROR line too long')
+                break
+            except (asyncio.IncompleteReadError, ConnectionError):
+                break
+            cmd, *args = line[:-2].decode(errors='replace').split() or ['']
+            handler = self.server.commands.get(cmd.upper())
+            if handler is None:
+                self.send('ERROR unknown command {}'.format(cmd))
+                continue
+            try:
+                self.server.signatures[cmd.upper()].bind(self, *args)
+            except TypeError:
+                self.send('ERROR wrong number of arguments to {}'.format(cmd))
+                continue
+            try:
+                if handler(self, *args) is False:
+                    break
+            except (IllegalMoveError, AlreadyScoredError, ValueError,
+                    IndexError) as e:
+                self.send('ERROR {}'.format(e))
+
+class Server:
+
+    def __init__(self, host='localhost', port=5555, max_queue=MAX_QUEUE,
+                 checkpoint=None, checkpoint_interval=CHECKPOINT_INTERVAL):
+        self.host = host
+        self.port = port
+        self.max_queue = max_queue
+        self.sessions = {}
+        self.checkpoint = None
+        self.checkpoint_interval = checkpoint_interval
+        # The checkpoint write in progress, if any
+        self.writing = None
+        if checkpoint is not None:
+            self.checkpoint = Checkpoint(checkpoint)
+            for name, game in load(checkpoint).items():
+                session = self.sessions[name] = Session(name)
+                session.start(game)
+                self.checkpoint.track(name, game)
+        self.commands = {
+            'JOIN': self.join,
+            'START': self.start,
+            'ROLL': self.roll,
+            'HOLD': self.hold,
+            'SCORE': self.score,
+            'WATCH': self.watch,
+            'BINARY': self.binary,
+            'QUIT': self.quit
+        }
+        # To check the arguments to a command before running it
+        self.signatures = {cmd: signature(handler)
+                           for cmd, handler in self.commands.items()}
+
+    async def handle_connection(self, reader, writer):
+        client = Client(self, reader, writer)
+        writer_task = asyncio.create_task(client.write_loop())
+        try:
+            await client.read_loop()
+        finally:
+            self.leave(client)
+            client.closed = True
+            try:
+                # Let the writer send whatever is queued, then stop.
+                client.queue.put_nowait(None)
+            except asyncio.QueueFull:
+                writer_task.cancel()
+            await asyncio.wait([writer_task])
+
+    async def serve(self):
+        server = await asyncio.start_server(self.handle_connection,
+                    self.host, self.port, limit=MAX_LINE, backlog=4096)
+        async with server:
+            if self.checkpoint is None:
+                await server.serve_forever()
+                return
+            saver = asyncio.create_task(self.save_checkpoints())
+            try:
+                await server.serve_forever()
+            finally:
+                saver.cancel()
+                if self.writing is not None:
+                    # Let a write already under way finish first.
+                    await asyncio.wait([self.writing])
+                self.checkpoint.close()
+
+    async def save_checkpoints(self):
+        # The records are encoded here, between moves, but written and
+        # synced to disk on another thread, so that a big write doesn't
+        # hold up every connection.
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.checkpoint_interval)
+            records = self.checkpoint.collect()
+            if records is not None:
+                self.writing = loop.run_in_executor(
+                    None, self.checkpoint.write, records)
+                await asyncio.shield(self.writing)
+
+    def end_game(self, session):
+        session.game = None
+        if self.checkpoint is not None:
+            self.checkpoint.forget(session.name)
+
+    def _game(self, client):
+        """Returns the game the client is playing, if it is their turn."""
+        session = client.session
+        if session is None or session.game is None:
+            raise IllegalMoveError('Not in a game that has started.')
+        if session.game.current_player.name != client.name:
+            raise IllegalMoveError('Not your turn.')
+        return session.game
+
+    def join(self, client, game_name, name):
+        if client.session is not None:
+            raise IllegalMoveError('Already in a game.')
+        session = self.sessions.setdefault(game_name, Session(game_name))
+        if name in session.clients:
+            raise IllegalMoveError('Name is taken.')
+        game = session.game
+        if game is not None and name not in game.scores:
+            raise IllegalMoveError('Game has already started.')
+        client.name = name
+        client.session = session
+        session.clients[name] = client
+        session.broadcast('JOINED {}'.format(name))
+        if game is not None:
+            # Rejoining a restored game, so catch up with it.
+            for data in session.catch_up(client.binary):
+                client.send_data(data)
+
+    def start(self, client):
+        session = client.session
+        if session is None or session.game is not None:
+            raise IllegalMoveError('No game to start.')
+        session.start()
+        if self.checkpoint is not None:
+            self.checkpoint.track(session.name, session.game)
+
+    # The session's listener on the game tells everyone about each move.
+
+    def roll(self, client):
+        self._game(client).roll()
+
+    def hold(self, client, *indices):
+        indices = [int(i) for i in indices]
+        if not all(0 <= i < 5 for i in indices):
+            raise IndexError('Dice indices must be 0-4.')
+        self._game(client).hold(indices)
+
+    def score(self, client, cat):
+        game = self._game(client)
+        if cat not in CATEGORIES:
+            raise ValueError('No such category: {}'.format(cat))
+        try:
+            game.place_score(cat)
+        except GameOver:
+            self.end_game(client.session)
+
+    def watch(self, client, game_name):
+        if client.session is not None:
+            raise IllegalMoveError('Already in a game.')
+        session = self.sessions.get(game_name)
+        if session is None:
+            raise ValueError('No such game: {}'.format(game_name))
+        client.session = session
+        session.spectators.add(client)
+        for data in session.catch_up(client.binary):
+            client.send_data(data)
+
+    def binary(self, client):
+        if client.session is not None:
+            raise IllegalMoveError('Already in a game.')
+        client.send('BINARY')
+        client.binary = True
+
+    def quit(self, client):
+        return False
+
+    def leave(self, client):
+        session = client.session
+        if session is None:
+            return
+        if client in session.spectators:
+            session.spectators.discard(client)
+            client.session = None
+            return
+        del session.clients[client.name]
+        client.session = None
+        if session.game is not None:
+            # The game can't go on without one of its players.
+            self.end_game(session)
+        session.broadcast('LEFT {}'.format(client.name))
+        if not session.clients:
+            del self.sessions[session.name]
+
+if __name__ == '__main__':
+
+    port = int(argv[1]) if len(argv) > 1 else 5555
+    checkpoint = argv[2] if len(argv) > 2 else None
+    asyncio.run(Server(port=port, checkpoint=checkpoint).serve())
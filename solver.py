@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Computes the strategy that maximises a single player's expected
+final score, under the rules implemented by game.Scorecard.
+
+A game state between turns is the set of categories already filled (as
+a bitmask over game.CATEGORIES) together with the upper section total,
+capped at the bonus threshold since anything above it makes no further
+difference.  solve() works backwards from the full scorecard and
+returns, for each state, the expected score still to come when playing
+optimally from it.  That table can be saved to (and memory-mapped back
+from) a .npy file, and Strategy uses it to choose holds and categories
+during a game without re-solving."""
+
+from collections import Counter
+from functools import lru_cache
+from itertools import combinations_with_replacement
+from math import factorial
+from os.path import abspath, dirname, join
+from sys import argv
+import time
+
+import numpy as np
+
+from game import ROLLS, SCORE_TABLE, CATEGORIES, UPPER_SECTION, roll_index
+
+DEFAULT_PATH = join(dirname(abspath(__file__)), 'values.npy')
+
+N_CATS = len(CATEGORIES)
+FULL = (1 << N_CATS) - 1
+BONUS_THRESHOLD = 63
+BONUS = 35
+
+SCORES = np.array(SCORE_TABLE, dtype=np.int64)
+
+def _multiset_prob(values):
+    """The probability of rolling exactly the values in `values`, in
+    any order, with len(values) dice."""
+    perms = factorial(len(values))
+    for c in Counter(values).values():
+        perms //= factorial(c)
+    return perms / 6 ** len(values)
+
+# Every multiset of 0-5 dice that a player could choose to keep.
+KEEPS = [k for n in range(6)
+         for k in combinations_with_replacement(range(1, 7), n)]
+KEEP_INDEX = {k: i for i, k in enumerate(KEEPS)}
+ROLL_PROBS = np.array([_multiset_prob(r) for r in ROLLS])
+
+@lru_cache(maxsize=None)
+def transitions():
+    """Returns an array whose [k, r] entry is the probability that
+    keeping KEEPS[k] and rolling the remaining dice gives ROLLS[r]."""
+    t = np.zeros((len(KEEPS), len(ROLLS)))
+    for k, keep in enumerate(KEEPS):
+        for rest in combinations_with_replacement(range(1, 7), 5-len(keep)):
+            t[k, roll_index(keep + rest)] += _multiset_prob(rest)
+    return t
+
+@lru_cache(maxsize=None)
+def roll_keeps():
+    """Returns an array whose [r, s] entry is the index in KEEPS of the
+    dice kept from ROLLS[r] when holding the dice at the positions set
+    in the 5-bit mask `s`."""
+    keeps = np.zeros((len(ROLLS), 32), dtype=np.int64)
+    for r, roll in enumerate(ROLLS):
+        for s in range(32):
+            keep = tuple(v for i, v in enumerate(roll) if s >> i & 1)
+            keeps[r, s] = KEEP_INDEX[keep]
+    return keeps
+
+def state(scorecard):
+    """Returns the (mask, upper) solver state of `scorecard`."""
+    return scorecard.filled, min(BONUS_THRESHOLD, int(scorecard.upper_score))
+
+def category_values(values, mask, upper):
+    """Returns an array whose [r, c, u] entry is the expected final
+    score still to come from scoring ROLLS[r] in category c, from state
+    (mask, upper[u]), or -inf if c is filled in `mask`."""
+    upper = np.asarray(upper)
+    cat = np.full((len(ROLLS), N_CATS, len(upper)), -np.inf)
+    for c in range(N_CATS):
+        if mask >> c & 1:
+            continue
+        following = values[mask | 1 << c]
+        score = SCORES[:, c, None]
+        if c < len(UPPER_SECTION):
+            new_upper = np.minimum(BONUS_THRESHOLD, upper + score)
+            bonus = np.where((upper < BONUS_THRESHOLD)
+                             & (new_upper >= BONUS_THRESHOLD), BONUS, 0)
+            cat[:, c] = score + bonus + following[new_upper]
+        else:
+            cat[:, c] = score + following[upper]
+    return cat
+
+def turn_values(values, mask, upper):
+    """Evaluates one turn from state (mask, upper[u]) for each u.
+    Returns (cat, k2, k1, expected): `cat` is as for category_values;
+    k2[k, u] and k1[k, u] are the expected scores still to come from
+    keeping KEEPS[k] after the second and first rolls respectively; and
+    expected[u] is the expected score still to come at the start of
+    the turn."""
+    t = transitions()
+    keeps = roll_keeps()
+    cat = category_values(values, mask, upper)
+    k2 = t @ cat.max(axis=1)
+    k1 = t @ k2[keeps].max(axis=1)
+    expected = ROLL_PROBS @ k1[keeps].max(axis=1)
+    return cat, k2, k1, expected
+
+def solve(verbose=False):
+    """Returns the value table: an array whose [mask, upper] entry is
+    the expected score still to come from that state under optimal
+    play.  Includes the upper section bonus, if not yet earned."""
+    values = np.zeros((FULL+1, BONUS_THRESHOLD+1))
+    upper = np.arange(BONUS_THRESHOLD+1)
+    # Filling a category only ever sets a bit, so every state a mask
+    # leads to has a higher number and has already been solved.
+    for mask in range(FULL-1, -1, -1):
+        values[mask] = turn_values(values, mask, upper)[3]
+        if verbose and not mask % 512:
+            print('{} states left'.format(mask))
+    return values
+
+def save(values, path=DEFAULT_PATH):
+    np.save(path, values.astype(np.float32))
+
+def load(path=DEFAULT_PATH):
+    """Memory-maps a value table saved by save()."""
+    return np.load(path, mmap_mode='r')
+
+class Strategy:
+
+    """Plays optimally using a value table.  Holds and categories are
+    worked out once per state (the first time they are needed) and
+    cached, so later queries are lookups.
+
+    Can be called with a Scorecard and a Dice that has been rolled at
+    least once, and returns either the category to score, or a list of
+    the indices of the dice to hold before rolling again."""
+
+    def __init__(self, values=None, path=DEFAULT_PATH, cache_size=4096):
+        self.path = path
+        self.values = load(path) if values is None else values
+        self.cache_size = cache_size
+        self._turn = lru_cache(maxsize=cache_size)(self._turn_values)
+
+    def __getstate__(self):
+        # Don't pickle a memory-mapped table (or the cache); the
+        # unpickling process can map the file for itself.  That's the
+        # file actually mapped, which needn't be self.path if the table
+        # was passed in.
+        state = {'path': self.path, 'cache_size': self.cache_size}
+        if isinstance(self.values, np.memmap) and self.values.filename:
+            state['path'] = self.values.filename
+        else:
+            state['values'] = self.values
+        return state
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def _turn_values(self, mask, upper):
+        cat, k2, k1, _ = turn_values(self.values, mask, [upper])
+        return cat[:, :, 0], k2[:, 0], k1[:, 0]
+
+    def expected_score(self, scorecard):
+        """The expected final score of `scorecard` under optimal play."""
+        mask, upper = state(scorecard)
+        return scorecard.total + float(self.values[mask, upper])
+
+    def best_category(self, scorecard, dice):
+        cat = self._turn(*state(scorecard))[0]
+        return CATEGORIES[int(np.argmax(cat[dice.index]))]
+
+    def best_hold(self, scorecard, dice):
+        """Returns the indices of the dice to hold before rolling again,
+        or None if `dice` has been rolled three times."""
+        if dice.rolled >= 3:
+            return None
+        hold_values = self._hold_values(scorecard, dice)
+        best = max(range(32), key=hold_values.__getitem__)
+        return [i for i in range(5) if best >> i & 1]
+
+    def _hold_values(self, scorecard, dice):
+        """Returns a list whose s'th item is the expected score still to
+        come from holding the dice at the positions set in the 5-bit
+        mask `s` and rolling the rest."""
+        _, k2, k1 = self._turn(*state(scorecard))
+        keep_values = k1 if dice.rolled <= 1 else k2
+        values = dice.values
+        return [float(keep_values[KEEP_INDEX[tuple(sorted(
+                    v for i, v in enumerate(values) if s >> i & 1))]])
+                for s in range(32)]
+
+    def __call__(self, scorecard, dice):
+        hold = self.best_hold(scorecard, dice)
+        if hold is None or len(hold) == 5:
+            # Holding everything is as good as scoring now.
+            return self.best_category(scorecard, dice)
+        return hold
+
+if __name__ == '__main__':
+
+    path = argv[1] if len(argv) > 1 else DEFAULT_PATH
+    start = time.perf_counter()
+    values = solve(verbose=True)
+    save(values, path)
+    print('Solved in {:.1f}s; expected score {:.2f}; saved to {}'.format(
+        time.perf_counter() - start, values[0, 0], path))
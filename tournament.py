@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Plays many headless games between computer strategies, spread over a
+pool of worker processes.
+
+A strategy is a picklable callable taking a Scorecard and a Dice that
+has been rolled at least once.  It returns either the name of the
+category to score, or a list of the indices of the dice to hold before
+rolling again.  solver.Strategy is one; greedy() and random_strategy()
+below are simpler ones."""
+
+from collections import Counter
+from math import sqrt
+from multiprocessing import Pool
+from sys import argv
+import random
+import time
+
+from game import Game, GameOver, CATEGORIES
+from rng import DiceRNG
+
+def random_strategy(scorecard, dice):
+    """Holds random dice and scores in a random open category."""
+    if dice.rolled < 3 and random.random() < 0.5:
+        return [i for i in range(5) if random.random() < 0.5]
+    return random.choice([c for c in CATEGORIES if not scorecard.is_filled(c)])
+
+def greedy(scorecard, dice):
+    """Holds the most common value, then takes the highest score
+    available."""
+    if dice.rolled < 3:
+        value, _ = dice.count.most_common(1)[0]
+        return [i for i, v in enumerate(dice.values) if v == value]
+    scores, filled = scorecard.preview(dice)
+    best = max((i for i in range(len(CATEGORIES)) if not filled[i]),
+               key=scores.__getitem__)
+    return CATEGORIES[best]
+
+def strategy_name(strategy):
+    return getattr(strategy, '__name__', type(strategy).__name__)
+
+def play_game(strategies, rng=None):
+    """Plays a game in which player i is controlled by strategies[i],
+    and returns the finished Game.  The dice are rolled using `rng`, if
+    given."""
+    game = Game([str(i) for i in range(len(strategies))], rng)
+    while True:
+        strategy = strategies[game._player_i]
+        game.roll()
+        move = strategy(game.current_player.scorecard, game.dice)
+        while not isinstance(move, str):
+            game.hold(move)
+            game.roll()
+            move = strategy(game.current_player.scorecard, game.dice)
+        try:
+            game.place_score(move)
+        except GameOver:
+            return game
+
+class Results:
+
+    """Running totals for the games played between a fixed line-up of
+    strategies.  Results from separate batches of games can be merged,
+    so nothing but these totals needs to be kept or sent between
+    processes."""
+
+    def __init__(self, names):
+        self.names = list(names)
+        self.games = 0
+        # Final score histograms, and wins (shared equally in a draw),
+        # for each seat
+        self.scores = [Counter() for _ in self.names]
+        self.wins = [0.0 for _ in self.names]
+
+    def add_game(self, game):
+        winners, _ = game.winners
+        for i, p in enumerate(game.players):
+            self.scores[i][p.scorecard.total] += 1
+            if p in winners:
+                self.wins[i] += 1 / len(winners)
+        self.games += 1
+
+    def merge(self, other):
+        for mine, theirs in zip(self.scores, other.scores):
+            mine.update(theirs)
+        self.wins = [a + b for a, b in zip(self.wins, other.wins)]
+        self.games += other.games
+        return self
+
+    def to_dict(self):
+        """Returns the totals as a dict that can be serialised as JSON."""
+        return {
+            'names': self.names,
+            'games': self.games,
+            'scores': [dict(c) for c in self.scores],
+            'wins': self.wins
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        results = cls(d['names'])
+        results.games = d['games']
+        # JSON object keys are always strings
+        results.scores = [Counter({int(s): n for s, n in c.items()})
+                          for c in d['scores']]
+        results.wins = list(d['wins'])
+        return results
+
+    def mean(self, i):
+        return sum(s * n for s, n in self.scores[i].items()) / self.games
+
+    def mean_interval(self, i, z=1.96):
+        """Returns the mean score of seat `i` with a normal-approximation
+        confidence interval (95% by default)."""
+        mean = self.mean(i)
+        var = sum(n * (s - mean) ** 2 for s, n in self.scores[i].items())
+        var /= max(1, self.games - 1)
+        half = z * sqrt(var / self.games)
+        return mean, mean - half, mean + half
+
+    def win_rate_interval(self, i, z=1.96):
+        """Returns the win rate of seat `i` with a Wilson score
+        confidence interval (95% by default)."""
+        n = self.games
+        p = self.wins[i] / n
+        centre = (p + z*z / (2*n)) / (1 + z*z / n)
+        half = z * sqrt(p * (1-p) / n + z*z / (4*n*n)) / (1 + z*z / n)
+        return p, centre - half, centre + half
+
+    def summary(self):
+        lines = ['{} games'.format(self.games)]
+        for i, name in enumerate(self.names):
+            lines.append(
+                '{}: mean score {:.2f} ({:.2f}-{:.2f}), '
+                'win rate {:.3f} ({:.3f}-{:.3f})'.format(
+                    name, *self.mean_interval(i), *self.win_rate_interval(i)))
+        return '\n'.join(lines)
+
+def play_games(strategies, seed, start, count):
+    """Plays games `start` to `start + count - 1` of the run seeded
+    with `seed`, yielding each game's number and the finished Game."""
+    rng = DiceRNG(seed)
+    for n in range(start, start + count):
+        # Every game gets its own streams (one for the dice, and the
+        # random module for any strategies that use it), so results
+        # don't depend on how the games were split between processes.
+        random.seed('{}:{}'.format(seed, n))
+        yield n, play_game(strategies, rng.spawn(n))
+
+def play_batch(args):
+    """Plays games `start` to `start + count - 1` of the run seeded
+    with `seed`, where `args` is (strategies, seed, start, count), and
+    returns their Results."""
+    strategies, seed, start, count = args
+    results = Results(strategy_name(s) for s in strategies)
+    for _, game in play_games(strategies, seed, start, count):
+        results.add_game(game)
+    return results
+
+def run(strategies, games, seed=0, processes=None, batch_size=100):
+    """Plays `games` games between `strategies` on a pool of
+    `processes` workers (by default, one per CPU) and returns the
+    Results.  The same seed always gives the same results."""
+    results = Results(strategy_name(s) for s in strategies)
+    batches = [(strategies, seed, start, min(batch_size, games - start))
+               for start in range(0, games, batch_size)]
+    with Pool(processes) as pool:
+        for batch in pool.imap_unordered(play_batch, batches):
+            results.merge(batch)
+    return results
+
+if __name__ == '__main__':
+
+    games = int(argv[1]) if len(argv) > 1 else 1000
+    start = time.perf_counter()
+    results = run([greedy, random_strategy], games)
+    print(results.summary())
+    print('{:.0f} games/s'.format(games / (time.perf_counter() - start)))
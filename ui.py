@@ -7,13 +7,37 @@ import tkinter
 from tkinter import N, W, E, S
 from tkinter.messagebox import askquestion, showinfo
 
-root = tkinter.Tk()
+from game import CATEGORIES
 
-# These are taken from yahtzee.py, TODO: pull them from a central source
-# se we're not replicating code.
-UPPER_SECTION = ['ones', 'twos', 'threes', 'fours', 'fives', 'sixes']
-LOWER_SECTION = ['3x', '4x', 'fh', 'ss', 'ls', 'y', 'c']
-CATEGORIES = UPPER_SECTION + LOWER_SECTION
+_root = None
+
+def get_root():
+    # The Tk root window is only created when the first interface is,
+    # rather than on import.
+    global _root
+    if _root is None:
+        _root = tkinter.Tk()
+    return _root
+
+_die_images = None
+
+def get_die_images():
+    # The die images, as lists of PhotoImages for the values 1-6, plain
+    # and inverted (for held dice).  They are read from disk the first
+    # time only and shared by every interface after that.
+    global _die_images
+    if _die_images is None:
+        get_root()
+        gfx_dir = join(dirname(abspath(argv[0])), 'gfx')
+        die_img_path = join(gfx_dir, 'dice_{}.png')
+        invert_img_path = join(gfx_dir, 'dice_{}_invert.png')
+        _die_images = (
+            [tkinter.PhotoImage(file=die_img_path.format(i+1))
+             for i in range(6)],
+            [tkinter.PhotoImage(file=invert_img_path.format(i+1))
+             for i in range(6)]
+        )
+    return _die_images
 
 # TODO: We have just implemented a Player class, so that needs to be
 # reflected throughout the code.
@@ -128,10 +152,30 @@ class PlayerColumn(tkinter.Frame):
             self.score_labels[c] = new_label
         self.total_score_label = tkinter.Label(self, text='0')
         self.total_score_label.grid(row=len(CATEGORIES)+1, column=0)
+        # What the column currently shows, so that updates which don't
+        # change anything don't touch the widgets.
+        self.is_current = None
+        self.total = 0
     
     def score(self, cat, score):
         self.score_labels[cat].config(text=score, relief=tkinter.SUNKEN)
     
+    def set_current(self, is_current):
+        if is_current != self.is_current:
+            self.config(relief='ridge' if is_current else 'flat')
+            self.is_current = is_current
+    
+    def set_total(self, total):
+        if total != self.total:
+            self.total_score_label.config(text=total)
+            self.total = total
+    
+    def clear(self):
+        # Empty the column for a new game.
+        for label in self.score_labels.values():
+            label.config(text='0', relief=tkinter.FLAT)
+        self.set_total(0)
+    
     def handle_score_click(self, event):
         self.presenter.place_player_score(self.player_name, event.widget.category)
 
@@ -143,6 +187,7 @@ class DieLabel(tkinter.Label):
         self.presenter = presenter
         self.die_imgs = die_imgs
         self.invert_die_imgs = invert_die_imgs
+        self.img = None
         tkinter.Label.__init__(self, master)
         self.presenter.update_die_label(self, init=True)
 
@@ -151,7 +196,9 @@ class DieLabel(tkinter.Label):
             img = self.invert_die_imgs[value-1]
         else:
             img = self.die_imgs[value-1]
-        self.config(image=img)
+        if img is not self.img:
+            self.config(image=img)
+            self.img = img
     
     def handle_click(self, event):
         self.presenter.toggle_die_hold(self)
@@ -166,25 +213,30 @@ class GameInterface(tkinter.Frame):
     
     def __init__(self, presenter, master=None):
         self.presenter = presenter
-        self.root = root
+        self.root = get_root()
         tkinter.Frame.__init__(self, master)
+        # Updates waiting to be drawn, keyed by what they update, so
+        # that only the latest update to each thing is drawn.  They are
+        # all drawn together once Tk is idle.
+        self.pending = {}
         self.get_die_images()
         self.create_widgets()
         self.grid()
     
     def get_die_images(self):
-        # Get images and store them as PhotoImage objects
-        gfx_dir = join(dirname(abspath(argv[0])), 'gfx')
-        die_img_path = join(gfx_dir, 'dice_{}.png')
-        invert_img_path = join(gfx_dir, 'dice_{}_invert.png')
-        self.die_imgs = []
-        self.invert_die_imgs = []
-        for i in range(6):
-            img_fname = die_img_path.format(i+1)
-            invert_fname = invert_img_path.format(i+1)
-            self.die_imgs.append(tkinter.PhotoImage(file=img_fname))
-            self.invert_die_imgs.append(
-                                tkinter.PhotoImage(file=invert_fname))
+        self.die_imgs, self.invert_die_imgs = get_die_images()
+    
+    def schedule(self, key, func, *args):
+        # Arrange for func(*args) to be called when Tk is next idle,
+        # replacing any update already waiting with the same key.
+        if not self.pending:
+            self.after_idle(self.draw_pending)
+        self.pending[key] = (func, args)
+    
+    def draw_pending(self):
+        pending, self.pending = self.pending, {}
+        for func, args in pending.values():
+            func(*args)
     
     def disable_roll(self):
         # Prevent a user from clicking the "roll" button.
@@ -242,14 +294,31 @@ class GameInterface(tkinter.Frame):
     def update_player_col(self, p_name):
         # Update the column in light of current game state.
         pcol = self.player_cols[p_name]
-        if self.presenter.game.current_player.name == p_name:
-            pcol.config(relief='ridge')
-        else:
-            pcol.config(relief='flat')
-        pcol.total_score_label.config(text=self.presenter.players[p_name].scorecard.total)
-            
+        pcol.set_current(self.presenter.game.current_player.name == p_name)
+        pcol.set_total(self.presenter.players[p_name].scorecard.total)
+    
+    def set_current_player(self, p_name):
+        # set_current leaves alone any column whose relief is unchanged,
+        # so only two columns are actually redrawn.
+        for name, pcol in self.player_cols.items():
+            self.schedule((name, 'current'), pcol.set_current,
+                          name == p_name)
+    
     def add_player_score(self, p_name, cat, score):
-        self.player_cols[p_name].score(cat, score)
+        pcol = self.player_cols[p_name]
+        self.schedule((p_name, cat), pcol.score, cat, score)
+        self.schedule((p_name, 'total'), pcol.set_total,
+                      self.presenter.players[p_name].scorecard.total)
+    
+    def reset(self):
+        # Reuse the widgets for a new game.
+        self.pending = {}
+        for p_name, pcol in self.player_cols.items():
+            pcol.clear()
+            self.update_player_col(p_name)
+        for d in self.die_labels:
+            self.presenter.update_die_label(d)
+        self.enable_roll()
     
     def notify_winner(self, winner_name, score):
         play_again = askquestion(message='{} is the winner with a score of {}!\n\nPlay again?'.format(winner_name, score))
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""A compact binary encoding of game state, for keeping copies of a
+Game in sync between a server and its clients.
+
+Every frame starts with a one-byte type, and the type determines the
+frame's size:
+
+    STATE   the whole game: 4-byte header (type, number of players,
+            current player, whether the game is over), the dice word,
+            then 15 bytes per player (filled-category bitmask and one
+            byte per category score).
+    DICE    the dice word only (5 bytes).
+    SCORE   a single score placed: player, category and score (4 bytes).
+    TURN    the new current player (2 bytes).
+    TEXT    a line of the text protocol, for anything that has no frame
+            of its own: a 2-byte length, then the line in utf-8.
+
+The dice word is a 32-bit integer holding each die's value in 3 bits
+(die i in bits 3i to 3i+2), the hold mask in bits 15-19 and the number
+of times the dice have been rolled this turn in bits 20-21.
+
+Player names are not part of any frame; both ends are expected to
+agree on them (and their order) beforehand, such as by a TEXT frame."""
+
+from struct import Struct
+
+from game import CATEGORIES, CAT_INDEX
+
+STATE, DICE, SCORE, TURN, TEXT = range(5)
+
+_STATE_HEADER = Struct('!BBBBI')
+_SCORECARD = Struct('!H{}B'.format(len(CATEGORIES)))
+_DICE = Struct('!BI')
+_SCORE = Struct('!BBBB')
+_TURN = Struct('!BB')
+_TEXT = Struct('!BH')
+
+class WireError(Exception): pass
+
+def frame_size(data):
+    """Returns the size of the frame at the start of `data`, which needs
+    to hold at least its first two bytes (three, for a TEXT frame), or
+    None if it doesn't."""
+    if len(data) < 2:
+        return None
+    ftype = data[0]
+    if ftype == STATE:
+        return _STATE_HEADER.size + data[1] * _SCORECARD.size
+    if ftype == TEXT:
+        if len(data) < _TEXT.size:
+            return None
+        return _TEXT.size + _TEXT.unpack_from(data)[1]
+    try:
+        return {DICE: _DICE.size, SCORE: _SCORE.size, TURN: _TURN.size}[ftype]
+    except KeyError:
+        raise WireError('Unknown frame type {}.'.format(ftype))
+
+def pack_dice(dice):
+    if hasattr(dice, 'word'):
+        # compact.CompactDice already stores its state this way
+        return dice.word
+    word = dice.rolled << 20
+    for i, d in enumerate(dice.dice):
+        word |= d.value << 3*i | d.is_held << 15+i
+    return word
+
+def unpack_dice(word, dice):
+    """Sets the values, holds and roll count of `dice` from `word`."""
+    if hasattr(dice, 'word'):
+        dice.word = word
+        return
+    for i, d in enumerate(dice.dice):
+        d.value = word >> 3*i & 7
+        d.is_held = bool(word >> 15+i & 1)
+    dice.rolled = word >> 20 & 3
+
+def encode_state(game):
+    parts = [_STATE_HEADER.pack(STATE, len(game.players), game._player_i,
+                                game.is_over, pack_dice(game.dice))]
+    for p in game.players:
+        sc = p.scorecard
+        parts.append(_SCORECARD.pack(sc.filled,
+                                     *(int(sc.scores[c]) for c in CATEGORIES)))
+    return b''.join(parts)
+
+def encode_dice(dice):
+    return _DICE.pack(DICE, pack_dice(dice))
+
+def encode_score(player_i, cat, score):
+    return _SCORE.pack(SCORE, player_i, CAT_INDEX[cat], score)
+
+def encode_turn(player_i):
+    return _TURN.pack(TURN, player_i)
+
+def encode_text(line):
+    data = line.encode()
+    return _TEXT.pack(TEXT, len(data)) + data
+
+def decode_text(frame):
+    """Returns the line in a TEXT frame."""
+    return bytes(frame[_TEXT.size:]).decode()
+
+def _apply_state(game, data):
+    _, n, player_i, is_over, word = _STATE_HEADER.unpack_from(data)
+    if n != len(game.players):
+        raise WireError('State is for {} players, not {}.'.format(
+                        n, len(game.players)))
+    game._player_i = player_i
+    game.is_over = bool(is_over)
+    unpack_dice(word, game.dice)
+    offset = _STATE_HEADER.size
+    for p in game.players:
+        filled, *scores = _SCORECARD.unpack_from(data, offset)
+        p.scorecard.set_scores(filled, scores)
+        offset += _SCORECARD.size
+
+def _apply_dice(game, data):
+    unpack_dice(_DICE.unpack_from(data)[1], game.dice)
+
+def _apply_score(game, data):
+    _, player_i, cat_i, score = _SCORE.unpack_from(data)
+    game.players[player_i].scorecard.handle_score(score, CATEGORIES[cat_i])
+
+def _apply_turn(game, data):
+    game._player_i = data[1]
+    game.dice.release()
+    game.dice.rolled = 0
+
+_APPLY = {
+    STATE: _apply_state,
+    DICE: _apply_dice,
+    SCORE: _apply_score,
+    TURN: _apply_turn
+}
+
+def apply(game, frame):
+    """Updates `game` from a single frame.  TEXT frames don't change
+    the game, and are ignored."""
+    if frame[0] == TEXT:
+        return
+    try:
+        handler = _APPLY[frame[0]]
+    except KeyError:
+        raise WireError('Unknown frame type {}.'.format(frame[0]))
+    handler(game, frame)
+
+def split_frames(data):
+    """Splits `data` into complete frames.  Returns a list of the frames
+    and the number of bytes used, so that any partial frame at the end
+    can be kept until the rest of it arrives."""
+    frames = []
+    offset = 0
+    view = memoryview(data)
+    while True:
+        size = frame_size(view[offset:offset+_TEXT.size])
+        if size is None or len(data) - offset < size:
+            break
+        frames.append(view[offset:offset+size])
+        offset += size
+    return frames, offset